@@ -1,9 +1,13 @@
-const { Gio } = imports.gi;
+const { Gio, GLib } = imports.gi;
 const Applet = imports.ui.applet;
 const Mainloop = imports.mainloop;
 const Settings = imports.ui.settings;
 const PopupMenu = imports.ui.popupMenu;
 const WALLPAPER_MANAGER_PATH = `${__dirname}/wallpaper-manager.sh`;
+// Resident control service exported by wallpaper-shuffle-gtk.py (window or --service)
+const SERVICE_NAME = "io.github.abcdqfr.WallpaperShuffle";
+const SERVICE_PATH = "/io/github/abcdqfr/WallpaperShuffle";
+const SERVICE_METHODS = { next: "Next", prev: "Prev", random: "Random", exit: "Stop" };
 class WallpaperShuffleApplet extends Applet.TextIconApplet {
     constructor(metadata, orientation, panelHeight, instanceId) {
         global.log('WallpaperShuffleApplet: Constructor started');
@@ -32,6 +36,15 @@ class WallpaperShuffleApplet extends Applet.TextIconApplet {
         this.menu.addMenuItem(new Applet.MenuItem("Toggle Timer", null, () => this._toggleTimer()));
         ["next", "prev", "random", "exit"].forEach(cmd => this._addMenuItem(cmd));
         this.actor.connect("button-press-event", () => this.menu.toggle());
+        this._stateSubscription = Gio.DBus.session.signal_subscribe(
+            null, SERVICE_NAME, "StateChanged", SERVICE_PATH, null, Gio.DBusSignalFlags.NONE,
+            (connection, sender, path, iface, signal, params) => {
+                const [command, ok, state] = params.deep_unpack();
+                if (ok && !this.timer) {
+                    this.set_applet_tooltip(`Current: ${state.currentWallpaper || "None"}`);
+                }
+            }
+        );
     }
     _bindSettings() {
         const properties = [
@@ -95,8 +108,38 @@ class WallpaperShuffleApplet extends Applet.TextIconApplet {
             global.logError(`Failed to run command: ${err.message}`);
         }
     }
+    _callService(method, params, fallback, onDone = null) {
+        // Falls back to wallpaper-manager.sh only when no service owns the name
+        Gio.DBus.session.call(SERVICE_NAME, SERVICE_PATH, SERVICE_NAME, method, params, null,
+            Gio.DBusCallFlags.NO_AUTO_START, -1, null, (connection, res) => {
+                try {
+                    connection.call_finish(res);
+                    if (onDone) {
+                        onDone();
+                    }
+                } catch (err) {
+                    if (err.matches(Gio.DBusError, Gio.DBusError.SERVICE_UNKNOWN) ||
+                        err.matches(Gio.DBusError, Gio.DBusError.NAME_HAS_NO_OWNER)) {
+                        fallback();
+                    } else if (Gio.DBusError.get_remote_error(err) !== `${SERVICE_NAME}.Error.Superseded`) {
+                        // A later command replacing this one before it ran is not a failure
+                        global.logError(`Wallpaper Shuffle ${method} failed: ${err.message}`);
+                    }
+                }
+            });
+    }
+    _runManagerCommand(command) {
+        this._callService(SERVICE_METHODS[command], null, () => {
+            this._runCommandAsync(`${WALLPAPER_MANAGER_PATH} ${command}`);
+        }, command === "exit" ? () => this._runCommandAsync("cinnamon --replace &") : null);
+    }
+    _setSetting(setting, value) {
+        this._callService("SetSetting", new GLib.Variant("(ss)", [setting, String(value)]), () => {
+            this._runCommandAsync(`${WALLPAPER_MANAGER_PATH} settings ${setting} ${value}`);
+        });
+    }
     _addMenuItem(command) {
-        this.menu.addMenuItem(new Applet.MenuItem(command.charAt(0).toUpperCase() + command.slice(1), null, () => this._runCommandAsync(`${WALLPAPER_MANAGER_PATH} ${command}`)));
+        this.menu.addMenuItem(new Applet.MenuItem(command.charAt(0).toUpperCase() + command.slice(1), null, () => this._runManagerCommand(command)));
     }
     _updateStatus() {
         const settingsPath = `${GLib.get_home_dir()}/.cinnamon/configs/wallpaper-shuffle@abcdqfr/settings.json`;
@@ -134,7 +177,7 @@ class WallpaperShuffleApplet extends Applet.TextIconApplet {
                     this._updateTooltip();
                     return true; // Continue timer
                 } else {
-                    this._runCommandAsync(`${WALLPAPER_MANAGER_PATH} next`);
+                    this._runManagerCommand("next");
                     this.remaining = this.shuffleInterval * 60;
                     this._updateTooltip("Timer reset");
                     return true; // Continue timer
@@ -180,9 +223,7 @@ class WallpaperShuffleApplet extends Applet.TextIconApplet {
                     } else if (setting === 'shuffleInterval') {
                         value = Math.max(1, Math.min(1440, parseInt(value) || 5));
                     }
-                    this._runCommandAsync(
-                        `${WALLPAPER_MANAGER_PATH} settings ${setting} ${value}`
-                    );
+                    this._setSetting(setting, value);
                     global.log(`Updated ${setting} to ${value}`);
                 }
             });
@@ -235,7 +276,11 @@ class WallpaperShuffleApplet extends Applet.TextIconApplet {
         if (this.settings) {
             this.settings.finalize();
         }
-        this._runCommandAsync(`${WALLPAPER_MANAGER_PATH} exit`);
+        if (this._stateSubscription) {
+            Gio.DBus.session.signal_unsubscribe(this._stateSubscription);
+            this._stateSubscription = null;
+        }
+        this._runManagerCommand("exit");
     }
     on_applet_config_changed() {
         global.log('Wallpaper Shuffle: Config changed called');
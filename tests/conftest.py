@@ -0,0 +1,40 @@
+import importlib.util, json, sys, time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+@pytest.fixture(scope="session")
+def app():
+    """wallpaper-shuffle-gtk.py as a module; its file name is not a valid module name"""
+    pytest.importorskip("gi")
+    spec = importlib.util.spec_from_file_location("wallpaper_shuffle", ROOT / "wallpaper-shuffle-gtk.py")
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except (ImportError, ValueError) as e:
+        pytest.skip(f"GTK 3 introspection data unavailable: {e}")
+    sys.modules[spec.name] = module
+    return module
+
+@pytest.fixture
+def run_until(app):
+    """Iterate the GLib main context until predicate() holds, so idle callbacks get delivered"""
+    def run(predicate, timeout=5.0):
+        context = app.GLib.MainContext.default()
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                raise AssertionError("timed out waiting for the main loop")
+            if not context.iteration(False):
+                time.sleep(0.01)
+    return run
+
+@pytest.fixture
+def settings(app, tmp_path):
+    def make(**values):
+        path = tmp_path / "settings-schema.json"
+        path.write_text(json.dumps({key: {"value": value} for key, value in values.items()}))
+        return app.SettingsStore(path)
+    return make
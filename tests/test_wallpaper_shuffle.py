@@ -0,0 +1,229 @@
+import os, signal, subprocess, sys, threading, time
+
+import pytest
+
+XRANDR_LISTING = """Monitors: 3
+ 0: +HDMI-1 1920/527x1080/296+2560+0  HDMI-1
+ 1: +*DP-1 2560/597x1440/336+0+0  DP-1
+ 2: +DP-2 1920/527x1080/296+4480+0  DP-2
+"""
+
+# Stands in for linux-wallpaperengine; the name matters, stop() checks /proc/<pid>/cmdline for it
+STUB_ENGINE = f"""#!{sys.executable}
+import os, signal, time
+if os.environ.get("STUB_IGNORE_SIGTERM"):
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+time.sleep(3600)
+"""
+
+class FakeEngine:
+    """Records commands; each one blocks until release() so later ones pile up in the queue"""
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Event()
+        self._gate = threading.Event()
+
+    def release(self):
+        self._gate.set()
+
+    def _run(self, *call):
+        self.calls.append(call)
+        self.started.set()
+        self._gate.wait(5)
+        return True
+
+    def step(self, delta):
+        return self._run("step", delta)
+
+    def load(self, wallpaper_id=None):
+        return self._run("load", wallpaper_id)
+
+    def random(self):
+        return self._run("random")
+
+    def restart(self):
+        return self._run("restart")
+
+    def stop(self):
+        return self._run("stop")
+
+@pytest.fixture
+def busy_queue(app):
+    """A CommandQueue whose engine is busy with random(), plus the engine"""
+    engine = FakeEngine()
+    commands = app.CommandQueue(engine)
+    commands.random()
+    assert engine.started.wait(5)
+    yield commands, engine
+    engine.release()
+    commands.close()
+
+def submit_all(commands, submissions):
+    results = {}
+    for index, (kind, *args) in enumerate(submissions):
+        commands.submit(kind, *args, callback=lambda ok, index=index: results.__setitem__(index, ok))
+    return results
+
+def test_steps_coalesce_and_every_caller_gets_the_result(busy_queue, run_until):
+    commands, engine = busy_queue
+    results = submit_all(commands, [("step", 1)] * 4)
+    engine.release()
+    run_until(lambda: len(results) == 4)
+    assert engine.calls[1:] == [("step", 4)]
+    assert results == {0: True, 1: True, 2: True, 3: True}
+
+def test_step_queues_behind_a_waiting_load(busy_queue, run_until):
+    commands, engine = busy_queue
+    results = submit_all(commands, [("load", "X"), ("step", 1)])
+    engine.release()
+    run_until(lambda: len(results) == 2)
+    assert engine.calls[1:] == [("load", "X"), ("step", 1)]
+
+def test_stop_is_final_and_later_commands_are_superseded(busy_queue, run_until):
+    commands, engine = busy_queue
+    results = submit_all(commands, [("step", 1), ("stop",), ("step", 1)])
+    engine.release()
+    run_until(lambda: len(results) == 3)
+    assert engine.calls[1:] == [("stop",)]
+    assert results == {0: None, 1: True, 2: None}
+
+@pytest.fixture
+def library(app, tmp_path):
+    root = tmp_path / "431960"
+    for index in range(20):
+        (root / str(100 + index)).mkdir(parents=True)
+    index = app.LibraryIndex(root, db_path=tmp_path / "library.db")
+    index.refresh()
+    yield index
+    index.close()
+
+def test_shuffle_bag_and_history_survive_a_restart(app, library, tmp_path):
+    playlist = app.Playlist(library, scope="DP-1")
+    drawn = [playlist.shuffle() for _ in range(5)]
+    remaining, history = list(playlist.bag), list(playlist.history)
+    library.close()
+
+    reopened = app.LibraryIndex(library.root, db_path=tmp_path / "library.db")
+    try:
+        restored = app.Playlist(reopened, scope="DP-1")
+        assert restored.current == drawn[-1]
+        assert restored.bag == remaining
+        assert list(restored.history) == history
+        # Nothing repeats until the bag is empty
+        assert not set(drawn) & {restored.shuffle() for _ in range(len(remaining))}
+    finally:
+        reopened.close()
+
+def test_favorites_are_shared_between_outputs(app, library):
+    primary, secondary = app.Playlist(library), app.Playlist(library, scope="HDMI-1")
+    assert primary.toggle_favorite("104")
+    assert secondary.is_favorite("104")
+
+def write_supply(root, name, **files):
+    supply = root / name
+    supply.mkdir(parents=True)
+    for key, value in files.items():
+        (supply / key).write_text(f"{value}\n")
+
+def test_power_monitor_reads_a_fake_sysfs_tree(app, tmp_path):
+    write_supply(tmp_path, "AC", type="Mains", online=0)
+    write_supply(tmp_path, "BAT0", type="Battery", status="Discharging")
+    write_supply(tmp_path, "hid-mouse-battery", type="Battery", scope="Device", status="Discharging")
+    monitor = app.PowerMonitor(tmp_path)
+    assert monitor.on_battery()
+
+    (tmp_path / "AC" / "online").write_text("1\n")
+    assert not monitor.on_battery()
+
+    (tmp_path / "AC" / "online").write_text("0\n")
+    (tmp_path / "BAT0" / "status").write_text("Charging\n")
+    assert not monitor.on_battery()  # A discharging mouse alone is not running on battery
+
+def test_output_detector_puts_the_primary_output_first(app):
+    assert app.OutputDetector.parse(XRANDR_LISTING) == ["DP-1", "HDMI-1", "DP-2"]
+    assert app.OutputDetector(listing=XRANDR_LISTING).outputs()[0] == "DP-1"
+    assert app.OutputDetector.parse("") == []
+
+@pytest.fixture
+def stub_engine(tmp_path):
+    path = tmp_path / "linux-wallpaperengine"
+    path.write_text(STUB_ENGINE)
+    path.chmod(0o755)
+    return path
+
+@pytest.fixture
+def engine(app, settings, stub_engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(app.EngineController, "STOP_TIMEOUT", 0.3)
+    controller = app.EngineController(settings(), executable=str(stub_engine),
+                                      pid_file=tmp_path / "engine.pid", output="STUB-1")
+    yield controller
+    controller.stop()
+
+def test_stop_terminates_the_engine(engine):
+    assert engine.start("100")
+    process = engine.process
+    engine.stop()
+    assert process.returncode == -signal.SIGTERM
+    assert not engine.pid_file.exists()
+
+def test_stop_kills_an_engine_that_ignores_sigterm(engine, monkeypatch):
+    monkeypatch.setenv("STUB_IGNORE_SIGTERM", "1")
+    assert engine.start("100")
+    process = engine.process
+    time.sleep(0.5)  # Let the stub install its handler
+    engine.stop()
+    assert process.returncode == -signal.SIGKILL
+
+def test_stop_reaches_an_engine_recorded_by_a_previous_run(engine, stub_engine, monkeypatch):
+    monkeypatch.setenv("STUB_IGNORE_SIGTERM", "1")
+    leftover = subprocess.Popen([str(stub_engine)])
+    try:
+        time.sleep(0.5)
+        engine.pid_file.write_text(str(leftover.pid))
+        engine.stop()
+        assert leftover.wait(5) == -signal.SIGKILL
+    finally:
+        if leftover.poll() is None:
+            leftover.kill()
+            leftover.wait()
+
+@pytest.fixture
+def control_service(app, settings, run_until):
+    if not os.environ.get("DBUS_SESSION_BUS_ADDRESS"):
+        pytest.skip("needs a session bus; run under dbus-run-session")
+    store = settings(maxFps=60)
+    service = app.ControlService(store, [])
+    run_until(lambda: service._registration)
+    yield service, store
+    service.close()
+    store.flush()
+
+def call(app, run_until, service, method, *args):
+    """Call a ControlService method asynchronously, since the service answers from this main loop"""
+    Gio, GLib = app.Gio, app.GLib
+    parameters = GLib.Variant("(ss)", args) if args else None
+    result = {}
+
+    def finished(connection, res):
+        try:
+            result["value"] = connection.call_finish(res).unpack()
+        except GLib.Error as e:
+            result["error"] = Gio.DBusError.get_remote_error(e)
+
+    service.connection.call(service.connection.get_unique_name(), service.OBJECT_PATH, service.BUS_NAME,
+                            method, parameters, None, Gio.DBusCallFlags.NONE, 5000, None, finished)
+    run_until(lambda: result)
+    return result
+
+@pytest.mark.parametrize("value", ["inf", "1e400", "nan", "abc", "0", "241"])
+def test_set_setting_rejects_invalid_values(app, control_service, run_until, value):
+    service, store = control_service
+    result = call(app, run_until, service, "SetSetting", "maxFps", value)
+    assert result == {"error": f"{service.BUS_NAME}.Error.InvalidSetting"}
+    assert store.get("maxFps") == 60
+
+def test_set_setting_round_trip(app, control_service, run_until):
+    service, store = control_service
+    assert call(app, run_until, service, "SetSetting", "maxFps", "90") == {"value": ()}
+    assert store.get("maxFps") == 90
+    assert call(app, run_until, service, "GetState")["value"] == ({"currentWallpaper": ""},)
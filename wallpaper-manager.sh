@@ -35,6 +35,7 @@ Available Settings:
         wallpaperDir         Path to directory containing wallpapers
         linuxWpePath         Path to linux-wallpaperengine build
         screenRoot           Display output name for wallpaper
+        outputs              Comma-separated outputs with their own engine (GTK app)
 
     Display Settings:
         scalingMode          default | stretch | fit | fill
@@ -60,6 +61,7 @@ Settings:
     wallpaperDir    path    (Directory containing wallpapers)
     linuxWpePath    path    (Path to linux-wallpaperengine build)
     screenRoot      name    (Display output for wallpaper)
+    outputs         names   (Outputs that each get an engine in the GTK app)
     volumeLevel     0-100   (Audio volume percentage)
     muteAudio       true/false (Mute wallpaper audio)
     disableMouse    true/false (Disable mouse interaction)
@@ -93,7 +95,7 @@ get_setting() {
 set_setting() {
     [ ! -f "$SETTINGS_FILE" ] && echo "{}" > "$SETTINGS_FILE"
     local temp_file=$(mktemp)
-    local numeric_keys='["volumeLevel", "maxFps", "shuffleInterval"]'
+    local numeric_keys='["volumeLevel", "maxFps", "shuffleInterval", "thumbnailCacheMb", "pixbufCacheMb", "prewarmMemoryMb", "batteryMaxFps", "maxCpuPercent", "batteryMaxCpuPercent"]'
     local value_convert='if ($key | IN($numeric_keys[])) then (try ($value | tonumber) catch $value) else $value end'
     
     if jq --arg key "$1" --arg value "$2" \
@@ -181,6 +183,37 @@ load_wallpaper() {
     set_setting "currentWallpaper" "$WALLPAPER"
 }
 
+SERVICE="io.github.abcdqfr.WallpaperShuffle"
+SERVICE_PATH="/io/github/abcdqfr/WallpaperShuffle"
+
+service_running() {
+    command -v gdbus >/dev/null && gdbus call --session --dest org.freedesktop.DBus \
+        --object-path /org/freedesktop/DBus --method org.freedesktop.DBus.NameHasOwner "$SERVICE" 2>/dev/null | grep -q true
+}
+
+call_service() { gdbus call --session --dest "$SERVICE" --object-path "$SERVICE_PATH" --method "$SERVICE.$1" "${@:2}" >/dev/null; }
+
+# With wallpaper-shuffle-gtk.py running (window or --service), hand commands to it
+# so they are serialized with its own state changes. Returns 2 for commands it doesn't handle.
+forward_to_service() {
+    case "$1" in
+        next) call_service Next ;;
+        prev) call_service Prev ;;
+        random) call_service Random ;;
+        load) call_service Load "" ;;
+        load-id) call_service Load "$2" ;;
+        settings) [ -n "$2" ] && call_service SetSetting "$2" "$3" ;;
+        exit) call_service Stop && { cinnamon --replace & } ;;
+        *) return 2 ;;
+    esac
+}
+
+if service_running; then
+    forward_to_service "$@"
+    status=$?
+    [ "$status" -ne 2 ] && exit "$status"
+fi
+
 case "$1" in
     load) load_wallpaper ;;
     queue) build_queue "$(expand_path "$(get_setting "wallpaperDir" "$HOME/.steam/debian-installation/steamapps/workshop/content/431960")")" ;;
@@ -210,11 +243,17 @@ case "$1" in
         set_setting "currentIndex" "$((RANDOM % TOTAL))" && \
         load_wallpaper ;;
     settings)
-        kill_wpe
+        # load_wallpaper restarts the engine itself; keys that don't reload leave it running
         case "$2" in
             volumeLevel) [[ "$3" =~ ^[0-9]+\.?[0-9]*$ ]] && VOL=$(printf "%.0f" "$3") && [ "$VOL" -ge 0 ] && [ "$VOL" -le 100 ] && set_setting "$2" "$VOL" && load_wallpaper ;;
             maxFps) [[ "$3" =~ ^[0-9]+$ ]] && [ "$3" -ge 1 ] && [ "$3" -le 240 ] && set_setting "$2" "$3" && load_wallpaper ;;
             shuffleInterval) [[ "$3" =~ ^[0-9]+$ ]] && [ "$3" -ge 1 ] && [ "$3" -le 1440 ] && set_setting "$2" "$3" ;;
+            batteryMaxFps) [[ "$3" =~ ^[0-9]+$ ]] && [ "$3" -ge 1 ] && [ "$3" -le 240 ] && set_setting "$2" "$3" ;;
+            thumbnailCacheMb) [[ "$3" =~ ^[0-9]+$ ]] && [ "$3" -ge 16 ] && [ "$3" -le 4096 ] && set_setting "$2" "$3" ;;
+            pixbufCacheMb) [[ "$3" =~ ^[0-9]+$ ]] && [ "$3" -ge 16 ] && [ "$3" -le 1024 ] && set_setting "$2" "$3" ;;
+            prewarmMemoryMb|maxCpuPercent|batteryMaxCpuPercent) [[ "$3" =~ ^[0-9]+$ ]] && set_setting "$2" "$3" ;;
+            outputs) set_setting "$2" "$3" ;;
+            prewarmEngine|shuffleEnabled|batterySaver) set_setting "$2" "$(echo "$3" | tr '[:upper:]' '[:lower:]' | grep -E '^(true|1)$' >/dev/null && echo true || echo false)" ;;
             muteAudio|disableMouse|noAutomute|noAudioProcessing|noFullscreenPause) set_setting "$2" "$(echo "$3" | tr '[:upper:]' '[:lower:]' | grep -E '^(true|1)$' >/dev/null && echo true || echo false)" && load_wallpaper ;;
             scalingMode) [[ "$3" =~ ^(default|stretch|fit|fill)$ ]] && set_setting "$2" "$3" && load_wallpaper ;;
             clampingMode) [[ "$3" =~ ^(clamp|border|repeat)$ ]] && set_setting "$2" "$3" && load_wallpaper ;;
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""Headless benchmarks for the Wallpaper Shuffle hot paths; prints JSON to compare across revisions"""
+import argparse, importlib.util, json, os, random, resource, shutil, struct, subprocess
+import sys, tempfile, time
+from pathlib import Path
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf, GLib
+
+HERE = Path(__file__).resolve().parent
+
+def load_app():
+    """Import wallpaper-shuffle-gtk.py, whose file name is not a valid module name"""
+    spec = importlib.util.spec_from_file_location("wallpaper_shuffle", HERE / "wallpaper-shuffle-gtk.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class LibraryGenerator:
+    """Builds a synthetic workshop library of numbered folders sharing hard-linked template previews"""
+    FORMATS = (("jpg", 0.6), ("png", 0.25), ("gif", 0.15))
+    SIZES = {"jpg": (1280, 720), "png": (512, 512), "gif": (256, 256)}
+    TAGS = ("Anime", "Landscape", "Abstract", "Sci-Fi", "Nature", "Game", "Relaxing", "Pixel art")
+    WORDS = ("neon", "forest", "night", "city", "rain", "space", "ocean", "sunset", "dragon", "cat")
+    TEMPLATES_PER_FORMAT = 4
+
+    def __init__(self, root, seed=0):
+        self.root = Path(root)
+        self.rng = random.Random(seed)
+        self.templates = {}
+
+    def _noise_pixbuf(self, width, height):
+        data = GLib.Bytes.new(self.rng.randbytes(width * height * 3))
+        return GdkPixbuf.Pixbuf.new_from_bytes(data, GdkPixbuf.Colorspace.RGB, False, 8,
+                                               width, height, width * 3)
+
+    def _write_gif(self, path, width, height, frames=24):
+        """Write an animated GIF using uncompressed LZW (a clear code every 250 pixels)"""
+        palette = self.rng.randbytes(768)
+        out = bytearray(b"GIF89a" + struct.pack("<HHBBB", width, height, 0xF7, 0, 0) + palette)
+        out += b"\x21\xFF\x0BNETSCAPE2.0\x03\x01\x00\x00\x00"
+        for _ in range(frames):
+            out += b"\x21\xF9\x04\x04\x04\x00\x00\x00"
+            out += b"\x2C" + struct.pack("<HHHHB", 0, 0, width, height, 0) + b"\x08"
+            pixels = self.rng.randbytes(width * height)
+            data, buffer, bits = bytearray(), 0, 0
+            for index, pixel in enumerate(pixels):
+                for code in ((256, pixel) if index % 250 == 0 else (pixel,)):
+                    buffer |= code << bits
+                    bits += 9
+                    while bits >= 8:
+                        data.append(buffer & 0xFF)
+                        buffer >>= 8
+                        bits -= 8
+            buffer |= 257 << bits
+            bits += 9
+            while bits > 0:
+                data.append(buffer & 0xFF)
+                buffer >>= 8
+                bits -= 8
+            for start in range(0, len(data), 255):
+                block = data[start:start + 255]
+                out += bytes([len(block)]) + block
+            out += b"\x00"
+        out += b"\x3B"
+        path.write_bytes(out)
+
+    def _template(self, fmt):
+        pool = self.templates.setdefault(fmt, [])
+        if len(pool) < self.TEMPLATES_PER_FORMAT:
+            path = self.root / f".template-{fmt}-{len(pool)}.{fmt}"
+            width, height = self.SIZES[fmt]
+            if fmt == "gif":
+                self._write_gif(path, width, height)
+            else:
+                pixbuf = self._noise_pixbuf(width, height)
+                if fmt == "jpg":
+                    pixbuf.savev(str(path), "jpeg", ["quality"], ["85"])
+                else:
+                    pixbuf.savev(str(path), fmt, [], [])
+            pool.append(path)
+            return path
+        return self.rng.choice(pool)
+
+    def generate(self, count, missing_ratio=0.05):
+        self.root.mkdir(parents=True, exist_ok=True)
+        formats, weights = zip(*self.FORMATS)
+        for index in range(count):
+            folder = self.root / str(2000000000 + index)
+            folder.mkdir(exist_ok=True)
+            project = {
+                "title": " ".join(self.rng.sample(self.WORDS, 3)).title(),
+                "type": self.rng.choice(("scene", "video", "web")),
+                "tags": self.rng.sample(self.TAGS, 2),
+                "contentrating": "Everyone",
+            }
+            (folder / "project.json").write_text(json.dumps(project))
+            if self.rng.random() < missing_ratio:
+                continue
+            fmt = self.rng.choices(formats, weights)[0]
+            template = self._template(fmt)
+            target = folder / f"preview.{fmt}"
+            try:
+                os.link(template, target)
+            except OSError:
+                shutil.copyfile(template, target)
+        return self.root
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of seconds, in milliseconds"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+_run_peak_kib = 0  # Highest VmHWM seen before a reset
+
+def process_peak_rss_kib():
+    """Peak RSS of the whole run; clear_refs resets ru_maxrss together with VmHWM"""
+    return max(_run_peak_kib, peak_rss_kib())
+
+def reset_peak_rss():
+    """Reset VmHWM, so peak_rss_kib() covers only what runs from here on"""
+    global _run_peak_kib
+    _run_peak_kib = max(_run_peak_kib, peak_rss_kib())
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_kib():
+    """VmHWM since the last reset_peak_rss(), or the process peak where it can't be reset"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def summarize(samples, items=None, peak_kib=None):
+    total = sum(samples)
+    items = len(samples) if items is None else items
+    return {
+        "count": items,
+        "total_s": round(total, 4),
+        "throughput_per_s": round(items / total, 1) if total else None,
+        "p50_ms": percentile(samples, 0.50),
+        "p99_ms": percentile(samples, 0.99),
+        "peak_rss_kib": peak_rss_kib() if peak_kib is None else peak_kib,
+    }
+
+def bench_scan(app, library_root, workdir):
+    results = {}
+
+    # The pre-index scan: listdir + isdir + a nested listdir per folder
+    reset_peak_rss()
+    started = time.perf_counter()
+    found = 0
+    for wallpaper_id in os.listdir(library_root):
+        path = os.path.join(library_root, wallpaper_id)
+        if os.path.isdir(path):
+            found += any(f.startswith("preview.") and f.endswith((".jpg", ".png", ".gif"))
+                         for f in os.listdir(path))
+    results["scan_listdir"] = summarize([time.perf_counter() - started], found)
+
+    db_path = workdir / "library.db"
+    index = app.LibraryIndex(library_root, db_path=db_path)
+    reset_peak_rss()
+    started = time.perf_counter()
+    index.refresh()
+    results["scan_index_cold"] = summarize([time.perf_counter() - started], len(index.ids()))
+    reset_peak_rss()
+    started = time.perf_counter()
+    index.refresh()
+    results["scan_index_warm"] = summarize([time.perf_counter() - started], len(index.ids()))
+    return results, index
+
+def bench_decode(app, index, workdir, samples):
+    entries = index.entries()[:samples]
+    cache = app.ThumbnailCache(cache_dir=workdir / "thumbnails", max_bytes=1 << 40)
+    file_times, decode_times, hit_times = [], [], []
+    # The two decoders alternate per preview, so they share one peak
+    reset_peak_rss()
+    for wallpaper_id, preview, *_ in entries:
+        # Whole-file decode for comparison: every GIF frame, JPEGs at full resolution
+        started = time.perf_counter()
+        GdkPixbuf.Pixbuf.new_from_file_at_scale(preview, cache.SIZE, cache.SIZE, True)
+        file_times.append(time.perf_counter() - started)
+        
+        started = time.perf_counter()
+        pixbuf = cache.decode(preview)
+        decode_times.append(time.perf_counter() - started)
+        cache.store(preview, wallpaper_id, pixbuf)
+    decode_peak = peak_rss_kib()
+    reset_peak_rss()
+    for wallpaper_id, preview, *_ in entries:
+        started = time.perf_counter()
+        cache.lookup(preview, wallpaper_id)
+        hit_times.append(time.perf_counter() - started)
+    return {"decode_preview_file": summarize(file_times, peak_kib=decode_peak),
+            "decode_preview": summarize(decode_times, peak_kib=decode_peak),
+            "thumbnail_cache_hit": summarize(hit_times)}
+
+def bench_settings(app, workdir, rounds):
+    path = workdir / "settings-schema.json"
+    shutil.copyfile(HERE / "settings-schema.json", path)
+    store = app.SettingsStore(path)
+    read_times, write_times = [], []
+    reset_peak_rss()
+    for value in range(rounds):
+        started = time.perf_counter()
+        store._read()
+        read_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        store.set("maxFps", 30 + value % 200)
+        store.flush()
+        write_times.append(time.perf_counter() - started)
+    # Reads and writes alternate, so they share one peak
+    peak = peak_rss_kib()
+    return {"settings_read": summarize(read_times, peak_kib=peak),
+            "settings_write": summarize(write_times, peak_kib=peak)}
+
+def bench_playlist(app, index, steps):
+    """Navigation cost without an engine: sequential steps, history and shuffle-bag draws"""
+    playlist = app.Playlist(index)
+    results = {}
+    for name, move in (("playlist_next", playlist.next), ("playlist_back", playlist.back),
+                       ("playlist_shuffle", playlist.shuffle)):
+        times = []
+        reset_peak_rss()
+        for _ in range(steps):
+            started = time.perf_counter()
+            move()
+            times.append(time.perf_counter() - started)
+        results[name] = summarize(times)
+    return results
+
+def bench_switch(app, index, workdir, switches):
+    stub = workdir / "linux-wallpaperengine"
+    stub.write_text("#!/bin/sh\nexec sleep 3600\n")
+    stub.chmod(0o755)
+
+    path = workdir / "switch-settings.json"
+    path.write_text(json.dumps({"screenRoot": {"value": "BENCH-1"}}))
+    store = app.SettingsStore(path)
+    engine = app.EngineController(store, library=index, executable=str(stub),
+                                  pid_file=workdir / "engine.pid")
+    times = []
+    reset_peak_rss()
+    try:
+        for _ in range(switches):
+            started = time.perf_counter()
+            engine.step(1)
+            times.append(time.perf_counter() - started)
+    finally:
+        engine.stop()
+        store.flush()
+    return {"switch_stub_engine": summarize(times)}
+
+def revision():
+    try:
+        return subprocess.run(["git", "-C", str(HERE), "describe", "--always", "--dirty"],
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Wallpaper Shuffle hot paths")
+    parser.add_argument("--size", type=int, default=1000, help="synthetic library size (100-50000)")
+    parser.add_argument("--missing-ratio", type=float, default=0.05,
+                        help="fraction of folders without a preview")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--decode-samples", type=int, default=300)
+    parser.add_argument("--settings-rounds", type=int, default=200)
+    parser.add_argument("--switches", type=int, default=20)
+    parser.add_argument("--playlist-steps", type=int, default=500)
+    parser.add_argument("--workdir", help="keep the generated tree and caches here")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="wallpaper-shuffle-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    app = load_app()
+
+    try:
+        started = time.perf_counter()
+        library_root = LibraryGenerator(workdir / "431960", args.seed).generate(args.size, args.missing_ratio)
+        report = {
+            "revision": revision(),
+            "python": sys.version.split()[0],
+            "library_size": args.size,
+            "generate_s": round(time.perf_counter() - started, 2),
+            # Per-benchmark peak_rss_kib is reset between benchmarks where the kernel allows it
+            "peak_rss_per_benchmark": reset_peak_rss(),
+            "benchmarks": {},
+        }
+        results = report["benchmarks"]
+
+        scan, index = bench_scan(app, library_root, workdir)
+        results.update(scan)
+        results.update(bench_decode(app, index, workdir, args.decode_samples))
+        results.update(bench_settings(app, workdir, args.settings_rounds))
+        results.update(bench_playlist(app, index, args.playlist_steps))
+        results.update(bench_switch(app, index, workdir, args.switches))
+        report["peak_rss_kib"] = process_peak_rss_kib()
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -2,60 +2,2230 @@
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GdkPixbuf, GLib, Gio, Gdk
-import json, os, subprocess, threading, signal, logging, time
+import json, os, sys, subprocess, threading, signal, logging, time, hashlib, queue, itertools
+import argparse
+import random, select, tempfile, sqlite3, re, bisect, mmap, fcntl, math
 from pathlib import Path
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
-class ScriptRunner:
-    def __init__(self, script_path):
-        self.script = script_path
-        self.log = logging.getLogger('ScriptRunner')
-    
-    def run(self, *args, parent_window=None):
-        """Run command with proper GTK feedback"""
-        spinner = None
+STARTED = time.monotonic()
+SETTINGS_FILE = Path.home() / ".local/share/cinnamon/applets/wallpaper-shuffle@abcdqfr/settings-schema.json"
+
+class EngineController:
+    """Runs linux-wallpaperengine directly; only ever signals the pid it started or recorded"""
+    DEFAULT_WALLPAPER_DIR = "~/.steam/debian-installation/steamapps/workshop/content/431960"
+    DEFAULT_WPE_PATH = "~/linux-wallpaperengine/build"
+    STOP_TIMEOUT = 1.0
+    HANDOFF_DELAY = 1.5  # Seconds the outgoing engine keeps drawing while the new one loads
+    
+    def __init__(self, settings_store, library=None, executable=None, pid_file=None, output=None,
+                 detector=None):
+        self.settings = settings_store
+        self.executable = executable
+        self.output = output  # None follows screenRoot, falling back to the first detected output
+        self.detector = detector or OutputDetector()
+        if pid_file is None:
+            runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+            name = "engine.pid" if output is None else f"engine-{output}.pid"
+            pid_file = os.path.join(runtime_dir, "wallpaper-shuffle", name)
+        self.pid_file = Path(pid_file)
+        self.log = logging.getLogger('EngineController' if output is None else f'EngineController[{output}]')
+        self.process = None
+        self.primary = True  # Publishes currentWallpaper for the applet
+        self.current = (settings_store.get("currentWallpaper", "") or None) if output is None else None
+        self.switch_latencies = deque(maxlen=50)  # Seconds to spawn the engine
+        self.last_switch = None  # (seconds to spawn, seconds without a wallpaper)
+        self._prewarmed = None
+        self._retiring = {}  # Outgoing engine -> threading.Timer that stops it after the handoff
+        self.fps_cap = None  # Set by ShuffleScheduler while on battery
+        self.cpu_cap = None  # Likewise, limits shuffles to lightweight wallpapers
+        self.attach_library(library)
+    
+    def engine_path(self):
+        if self.executable:
+            return self.executable
+        wpe_dir = os.path.expanduser(self.settings.get("linuxWpePath", self.DEFAULT_WPE_PATH))
+        return os.path.join(wpe_dir, "linux-wallpaperengine")
+    
+    def default_screen(self):
+        outputs = self.detector.outputs()
+        return outputs[0] if outputs else ""
+    
+    def build_argv(self, wallpaper_id):
+        get = self.settings.get
+        argv = [self.engine_path()]
+        if get("disableMouse", False):
+            argv.append("--disable-mouse")
+        
+        if get("muteAudio", False):
+            argv.append("--silent")
+        else:
+            argv += ["--volume", str(int(round(float(get("volumeLevel", 50)))))]
+        
+        screen = self.output or get("screenRoot", "") or self.default_screen()
+        if screen:
+            argv += ["--screen-root", screen]
+        
+        scaling = get("scalingMode", "default")
+        if scaling in SettingsStore.CHOICES["scalingMode"]:
+            argv += ["--scaling", scaling]
+        clamping = get("clampingMode", "clamp")
+        if clamping in SettingsStore.CHOICES["clampingMode"]:
+            argv += ["--clamping", clamping]
+        
         try:
-            cmd = [self.script] + list(args)
-            cmd_str = ' '.join(str(arg) for arg in cmd)
-            self.log.debug(f"Running command: {cmd_str}")
-            
-            if parent_window:
-                # Show operation in progress using status label instead
-                if hasattr(parent_window, 'status_label'):
-                    original_text = parent_window.status_label.get_text()
-                    parent_window.status_label.set_text("Working...")
-                parent_window.set_sensitive(False)
-                
-                # Process GTK events
-                while Gtk.events_pending():
-                    Gtk.main_iteration()
+            fps = int(get("maxFps", 60))
+        except (TypeError, ValueError):
+            fps = None
+        if fps is not None and self.fps_cap is not None:
+            fps = min(fps, self.fps_cap)
+        if fps is not None and 1 <= fps <= 240:
+            argv += ["--fps", str(fps)]
+        
+        if get("noAutomute", False):
+            argv.append("--noautomute")
+        if get("noAudioProcessing", False):
+            argv.append("--no-audio-processing")
+        if get("noFullscreenPause", False):
+            argv.append("--no-fullscreen-pause")
+        
+        argv.append(str(wallpaper_id))
+        return argv
+    
+    def start(self, wallpaper_id):
+        """Replace the running engine with one showing wallpaper_id"""
+        started = time.monotonic()
+        argv = self.build_argv(wallpaper_id)
+        previous = self.process
+        overlap = (previous is not None and previous.poll() is None and
+                   self._can_overlap(previous.pid))
+        if not overlap:
+            self.stop()
+        
+        self.log.info(f"Starting engine: {' '.join(argv)}")
+        spawn_started = time.monotonic()
+        with TRACER.span("engine spawn", wallpaper=wallpaper_id, output=self.output or ""):
+            try:
+                self.process = subprocess.Popen(argv, cwd=os.path.dirname(argv[0]) or None,
+                                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                                stderr=subprocess.DEVNULL, start_new_session=True)
+            except OSError as e:
+                self.log.error(f"Failed to start engine: {e}")
+                self.process = previous if overlap else None
+                return False
+        self._write_pid(self.process.pid)
+        spawned = time.monotonic()
+        
+        if overlap:
+            self._retire(previous, wallpaper_id)
+        spawn = spawned - spawn_started
+        blank = 0.0 if overlap else spawned - started
+        self.switch_latencies.append(spawn)
+        self.last_switch = (spawn, blank)
+        self.log.info(f"Switched to {wallpaper_id}: engine spawned in {spawn * 1000:.0f} ms, "
+                      f"{blank * 1000:.0f} ms without a wallpaper")
+        
+        if self.current != wallpaper_id:
+            if self.primary:
+                self.settings.set("previousWallpaper", self.current or "")
+                self.settings.set("currentWallpaper", wallpaper_id)
+            self.current = wallpaper_id
+        if self.settings.get("prewarmEngine", False):
+            self.prewarm(self.upcoming())
+        return True
+    
+    def restart(self):
+        """Relaunch the running engine with current settings; a stopped one stays stopped"""
+        if self.process is None or self.process.poll() is not None or not self.current:
+            return True
+        return self.start(self.current)
+    
+    def _retire(self, process, wallpaper_id):
+        """Stop the outgoing engine once the new one has had HANDOFF_DELAY to load"""
+        incoming = self.process
+        
+        def handoff():
+            if incoming.poll() is not None:
+                self.log.warning(f"Engine for {wallpaper_id} exited during handoff")
+            self._terminate(process)
+            self._retiring.pop(process, None)
+        
+        timer = threading.Timer(self.HANDOFF_DELAY, handoff)
+        timer.daemon = True
+        self._retiring[process] = timer
+        timer.start()
+    
+    def stop(self):
+        for process, timer in list(self._retiring.items()):
+            timer.cancel()
+            self._terminate(process)
+            self._retiring.pop(process, None)
+        if self.process is not None:
+            process, self.process = self.process, None
+            self._terminate(process)
+        else:
+            self._stop_recorded()
+        try:
+            self.pid_file.unlink()
+        except OSError:
+            pass
+    
+    def _terminate(self, process):
+        if process.poll() is None:
+            with TRACER.span("engine kill", pid=process.pid):
+                process.terminate()
+                try:
+                    process.wait(self.STOP_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    self.log.warning(f"Engine {process.pid} ignored SIGTERM, killing it")
+                    process.kill()
+                    process.wait()
+    
+    def _memory_ceiling(self):
+        return int(self.settings.get("prewarmMemoryMb", 512)) * 1024 * 1024
+    
+    @staticmethod
+    def _read_kib(path, field):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(field + ":"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+    
+    def _can_overlap(self, pid):
+        """Two engines at once only if the running one fits the ceiling and memory is free"""
+        if not self.settings.get("prewarmEngine", False):
+            return False
+        rss = self._read_kib(f"/proc/{pid}/status", "VmRSS")
+        available = self._read_kib("/proc/meminfo", "MemAvailable")
+        if rss is None or available is None:
+            return False
+        if rss > self._memory_ceiling() or rss > available:
+            self.log.info(f"Not overlapping engines: {rss // 1048576} MiB engine, "
+                          f"{available // 1048576} MiB available")
+            return False
+        return True
+    
+    def upcoming(self):
+        """Wallpaper the next step will most likely load"""
+        if self.playlist is None:
+            return None
+        return self.playlist.peek(self._allowed())
+    
+    def prewarm(self, wallpaper_id):
+        """Pull the wallpaper's assets into the page cache, up to the memory ceiling"""
+        if not wallpaper_id or wallpaper_id == self._prewarmed or self.library is None:
+            return
+        self._prewarmed = wallpaper_id
+        path = os.path.join(self.library.root, wallpaper_id)
+        budget = self._memory_ceiling()
+        
+        def warm():
+            total = 0
+            for dirpath, _, filenames in os.walk(path):
+                for name in filenames:
+                    try:
+                        fd = os.open(os.path.join(dirpath, name), os.O_RDONLY)
+                    except OSError:
+                        continue
+                    try:
+                        size = os.fstat(fd).st_size
+                        if total + size > budget:
+                            return
+                        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                        total += size
+                    except OSError:
+                        pass
+                    finally:
+                        os.close(fd)
+            self.log.debug(f"Prewarmed {total // 1024} KiB for {wallpaper_id}")
+        
+        thread = threading.Thread(target=warm)
+        thread.daemon = True
+        thread.start()
+    
+    def _write_pid(self, pid):
+        try:
+            self.pid_file.parent.mkdir(parents=True, exist_ok=True)
+            self.pid_file.write_text(str(pid))
+        except OSError as e:
+            self.log.warning(f"Failed to record engine pid: {e}")
+    
+    def _stop_recorded(self):
+        """Stop an engine left running by a previous instance of the app"""
+        try:
+            pid = int(self.pid_file.read_text())
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if b"linux-wallpaperengine" not in f.read():
+                    return  # Pid was recycled by an unrelated process
+        except (OSError, ValueError):
+            return
+        with TRACER.span("engine kill", pid=pid, recorded=True):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                return
+            if not self._wait_pid(pid, self.STOP_TIMEOUT):
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    return
+                self._wait_pid(pid, self.STOP_TIMEOUT)
+    
+    @staticmethod
+    def _wait_pid(pid, timeout):
+        """Wait for a non-child pid to exit; a pidfd becomes readable when it does"""
+        try:
+            fd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                try:
+                    os.kill(pid, 0)
+                except OSError:
+                    return True
+                time.sleep(0.05)
+            return False
+        try:
+            return bool(select.select([fd], [], [], timeout)[0])
+        finally:
+            os.close(fd)
+    
+    def attach_library(self, library):
+        """Navigate the given LibraryIndex; its Playlist replaces the settings queue"""
+        self.library = library
+        self.playlist = Playlist(library, scope=self.output) if library is not None else None
+        if self.current is None and self.playlist is not None:
+            self.current = self.playlist.current
+    
+    def queue(self):
+        return self.playlist.queue if self.playlist is not None else []
+    
+    def load(self, wallpaper_id=None):
+        """Load wallpaper_id, or resume the playlist's current wallpaper"""
+        if self.playlist is None:
+            return self.start(wallpaper_id) if wallpaper_id else False
+        if wallpaper_id is None:
+            wallpaper_id = self.playlist.current or self.playlist.next(1)
+            if wallpaper_id is None:
+                return False
+        else:
+            self.playlist.select(wallpaper_id)
+        return self.start(wallpaper_id)
+    
+    def cpu_limit(self):
+        """Highest profiled CPU % a shuffle may pick, or None for no limit"""
+        limits = [limit for limit in (int(self.settings.get("maxCpuPercent", 0) or 0), self.cpu_cap)
+                  if limit]
+        return min(limits) if limits else None
+    
+    def _allowed(self):
+        """Queue entries within the CPU limit; unprofiled wallpapers always qualify"""
+        limit = self.cpu_limit()
+        if limit is None or self.library is None:
+            return None
+        costs = self.library.costs()
+        allowed = {wallpaper_id for wallpaper_id in self.queue()
+                   if wallpaper_id not in costs or costs[wallpaper_id][0] <= limit}
+        return allowed or None
+    
+    def step(self, delta):
+        """delta places forward along the queue, or back through the history"""
+        if self.playlist is None or not delta:
+            return False
+        if delta > 0:
+            wallpaper_id = self.playlist.next(delta, self._allowed())
+        else:
+            wallpaper_id = self.playlist.back(-delta, self._allowed())
+        return self.start(wallpaper_id) if wallpaper_id else False
+    
+    def random(self):
+        """Draw from the shuffle bag: no repeats until every wallpaper was shown"""
+        if self.playlist is None:
+            return False
+        wallpaper_id = self.playlist.shuffle(self._allowed())
+        return self.start(wallpaper_id) if wallpaper_id else False
+
+class OutputDetector:
+    """Connected outputs from `xrandr --listmonitors`; listing= parses canned output instead"""
+    COMMAND = ("xrandr", "--listmonitors")
+    
+    def __init__(self, listing=None):
+        self.listing = listing
+        self._outputs = None
+    
+    @staticmethod
+    def parse(listing):
+        """Output names in xrandr order, with the primary output moved first"""
+        outputs = []
+        for line in listing.splitlines():
+            fields = line.split()
+            # " 0: +*DP-1 2560/597x1440/336+0+0  DP-1"
+            if len(fields) < 4 or not fields[0].rstrip(":").isdigit():
+                continue
+            primary = "*" in fields[1]
+            outputs.insert(0, fields[-1]) if primary else outputs.append(fields[-1])
+        return outputs
+    
+    def refresh(self):
+        self._outputs = None
+    
+    def outputs(self):
+        if self._outputs is None:
+            listing = self.listing
+            if listing is None:
+                try:
+                    listing = subprocess.run(self.COMMAND, capture_output=True, text=True, timeout=5).stdout
+                except (OSError, subprocess.SubprocessError):
+                    listing = ""
+            self._outputs = self.parse(listing)
+        return self._outputs
+
+class LibraryIndex:
+    """Persistent SQLite index of the wallpaper folders under one library root"""
+    PREVIEW_EXTENSIONS = (".jpg", ".png", ".gif")
+    SETTLE_MS = 2000  # Workshop downloads create the folder before its files
+    METADATA_COLUMNS = ("title", "type", "tags", "rating")
+    ENTRY_QUERY = "SELECT id, preview, title, type, tags, rating FROM wallpapers"
+    INSERT = ("INSERT OR REPLACE INTO wallpapers (root, id, dir_mtime, preview, preview_mtime, "
+              "preview_size, title, type, tags, rating) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+    
+    def __init__(self, root, db_path=None):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        if db_path is None:
+            cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+            db_path = os.path.join(cache_home, "wallpaper-shuffle", "library.db")
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.log = logging.getLogger('LibraryIndex')
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; only the last commit may be lost
+        with self._db:
+            self._db.execute("""CREATE TABLE IF NOT EXISTS wallpapers (
+                root TEXT NOT NULL, id TEXT NOT NULL, dir_mtime REAL, preview TEXT,
+                preview_mtime REAL, preview_size INTEGER, PRIMARY KEY (root, id))""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS costs (
+                id TEXT PRIMARY KEY, cpu REAL, rss INTEGER, samples INTEGER)""")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(wallpapers)")}
+            if "title" not in columns:
+                for column in self.METADATA_COLUMNS:
+                    self._db.execute(f"ALTER TABLE wallpapers ADD COLUMN {column} TEXT")
+                # Force a rescan so existing rows pick up their project.json
+                self._db.execute("UPDATE wallpapers SET dir_mtime = NULL")
+        self.weights = None  # wallpaper_id -> shuffle weight, loaded by the first Playlist and shared
+        self._monitor = None
+        self._callback = None
+        self._dirty = set()
+        self._settle = 0
+        self._closed = False  # Set under _lock; a scan still running after close() drops its results
+    
+    def entries(self):
+        """(wallpaper_id, preview, title, type, tags, rating) for wallpapers with a preview"""
+        with self._lock:
+            if self._closed:
+                return []
+            return self._db.execute(
+                f"{self.ENTRY_QUERY} WHERE root = ? AND preview IS NOT NULL ORDER BY id",
+                (self.root,)).fetchall()
+    
+    def entry(self, wallpaper_id):
+        with self._lock:
+            if self._closed:
+                return None
+            return self._db.execute(f"{self.ENTRY_QUERY} WHERE root = ? AND id = ?",
+                                    (self.root, wallpaper_id)).fetchone()
+    
+    def ids(self):
+        with self._lock:
+            if self._closed:
+                return []
+            return [row[0] for row in self._db.execute(
+                "SELECT id FROM wallpapers WHERE root = ? ORDER BY id", (self.root,))]
+    
+    def costs(self):
+        """wallpaper_id -> (average CPU %, average RSS bytes)"""
+        with self._lock:
+            if self._closed:
+                return {}
+            return {row[0]: (row[1], row[2]) for row in self._db.execute("SELECT id, cpu, rss FROM costs")}
+    
+    def record_cost(self, wallpaper_id, cpu, rss):
+        """Fold a sample into the wallpaper's moving average and return the new average"""
+        with self._lock:
+            if self._closed:
+                return None
+            with self._db:
+                self._db.execute("""INSERT INTO costs VALUES (?, ?, ?, 1) ON CONFLICT(id) DO UPDATE SET
+                    cpu = cpu * 0.8 + excluded.cpu * 0.2, rss = CAST(rss * 0.8 + excluded.rss * 0.2 AS INTEGER),
+                    samples = samples + 1""", (wallpaper_id, cpu, rss))
+            return self._db.execute("SELECT cpu, rss FROM costs WHERE id = ?", (wallpaper_id,)).fetchone()
+    
+    def _scan_dir(self, wallpaper_id, dir_mtime):
+        path = os.path.join(self.root, wallpaper_id)
+        preview = preview_mtime = preview_size = None
+        with TRACER.span("scan dir", id=wallpaper_id):
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.name.startswith("preview.") and entry.name.endswith(self.PREVIEW_EXTENSIONS):
+                            st = entry.stat()
+                            preview, preview_mtime, preview_size = entry.path, st.st_mtime, st.st_size
+                            break
+            except OSError:
+                pass
+            return (self.root, wallpaper_id, dir_mtime, preview, preview_mtime, preview_size,
+                    *self._read_project(path))
+    
+    @staticmethod
+    def _read_project(path):
+        """title, type, tags and content rating from the folder's project.json"""
+        try:
+            with open(os.path.join(path, "project.json"), encoding="utf-8") as f:
+                project = json.load(f)
+        except (OSError, ValueError):
+            return None, None, None, None
+        if not isinstance(project, dict):
+            return None, None, None, None
+        tags = project.get("tags")
+        tags = ",".join(str(tag) for tag in tags) if isinstance(tags, list) else None
+        rating = project.get("contentrating") or project.get("rating")
+        return (str(project.get("title") or "") or None, str(project.get("type") or "").lower() or None,
+                tags, str(rating) if rating is not None else None)
+    
+    def refresh(self):
+        """Bring the index up to date; returns (added, removed, changed)"""
+        with self._lock:
+            if self._closed:
+                return [], [], []
+            known = dict(self._db.execute(
+                "SELECT id, dir_mtime FROM wallpapers WHERE root = ?", (self.root,)))
+        
+        with TRACER.span("scan", root=self.root) as span:
+            rows, seen = [], set()
+            try:
+                with os.scandir(self.root) as it:
+                    for entry in it:
+                        try:
+                            if not entry.is_dir():
+                                continue
+                            dir_mtime = entry.stat().st_mtime
+                        except OSError:
+                            continue
+                        seen.add(entry.name)
+                        if known.get(entry.name) != dir_mtime:
+                            rows.append(self._scan_dir(entry.name, dir_mtime))
+            except OSError as e:
+                self.log.error(f"Failed to scan {self.root}: {e}")
+                return [], [], []
+            removed = [wallpaper_id for wallpaper_id in known if wallpaper_id not in seen]
+            span.set(rescanned=len(rows), removed=len(removed))
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            with self._lock:
+                if self._closed:
+                    return [], [], []
+                with self._db:
+                    self._db.executemany(self.INSERT, rows)
+                    self._db.executemany("DELETE FROM wallpapers WHERE root = ? AND id = ?",
+                                         [(self.root, wallpaper_id) for wallpaper_id in removed])
+        
+        added = [(row[1], row[3], *row[6:]) for row in rows if row[1] not in known]
+        changed = [(row[1], row[3], *row[6:]) for row in rows if row[1] in known]
+        self.log.info(f"Library scan: {len(seen)} wallpapers, {len(added)} added, "
+                      f"{len(removed)} removed, {len(changed)} changed")
+        return added, removed, changed
+    
+    def update(self, wallpaper_id):
+        """Re-index a single folder; returns "added", "removed", "changed" or None"""
+        with self._lock:
+            if self._closed:
+                return None
+            existed = self._db.execute("SELECT 1 FROM wallpapers WHERE root = ? AND id = ?",
+                                       (self.root, wallpaper_id)).fetchone() is not None
+        path = os.path.join(self.root, wallpaper_id)
+        try:
+            st = os.stat(path)
+            is_dir = os.path.isdir(path)
+        except OSError:
+            is_dir = False
+        
+        with self._lock:
+            if self._closed:
+                return None
+            with self._db:
+                if not is_dir:
+                    if not existed:
+                        return None
+                    self._db.execute("DELETE FROM wallpapers WHERE root = ? AND id = ?",
+                                     (self.root, wallpaper_id))
+                    return "removed"
+                self._db.execute(self.INSERT, self._scan_dir(wallpaper_id, st.st_mtime))
+        return "changed" if existed else "added"
+    
+    def watch(self, callback):
+        """Call callback(added, removed, changed) on the main thread as folders come and go"""
+        if self._closed:
+            return False
+        self._callback = callback
+        self._monitor = Gio.File.new_for_path(self.root).monitor_directory(
+            Gio.FileMonitorFlags.WATCH_MOVES, None)
+        self._monitor.connect("changed", self._on_monitor_changed)
+        return False
+    
+    def _on_monitor_changed(self, monitor, file, other_file, event):
+        if event not in (Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.DELETED,
+                         Gio.FileMonitorEvent.MOVED_IN, Gio.FileMonitorEvent.MOVED_OUT,
+                         Gio.FileMonitorEvent.RENAMED, Gio.FileMonitorEvent.CHANGES_DONE_HINT):
+            return
+        self._dirty.add(file.get_basename())
+        if other_file is not None and event == Gio.FileMonitorEvent.RENAMED:
+            self._dirty.add(other_file.get_basename())
+        if self._settle:
+            GLib.source_remove(self._settle)
+        self._settle = GLib.timeout_add(self.SETTLE_MS, self._apply_dirty)
+    
+    def _apply_dirty(self):
+        self._settle = 0
+        dirty, self._dirty = self._dirty, set()
+        added, removed, changed = [], [], []
+        for wallpaper_id in dirty:
+            result = self.update(wallpaper_id)
+            if result == "removed":
+                removed.append(wallpaper_id)
+            elif result:
+                (added if result == "added" else changed).append(self.entry(wallpaper_id))
+        if added or removed or changed:
+            self._callback(added, removed, changed)
+        return False
+    
+    def close(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        if self._settle:
+            GLib.source_remove(self._settle)
+            self._settle = 0
+        # Waits for any query in flight; scans and Playlists still holding this index see _closed
+        with self._lock:
+            self._closed = True
+            self._db.close()
+
+class Playlist:
+    """Queue order, weighted shuffle bag, history and favorites for one library root"""
+    FAVORITE_WEIGHT = 4.0
+    HISTORY_LIMIT = 100
+    
+    def __init__(self, library, scope=None):
+        self.library = library
+        # Each output keeps its own cursor, bag and history; favorites are shared
+        self.key = library.root if scope is None else f"{library.root}#{scope}"
+        self.log = logging.getLogger('Playlist')
+        self._lock = threading.RLock()
+        self._db = library._db
+        with library._lock, self._db:
+            self._db.execute("""CREATE TABLE IF NOT EXISTS playlist_state (
+                root TEXT PRIMARY KEY, current TEXT)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS playlist_bag (
+                root TEXT NOT NULL, pos INTEGER NOT NULL, id TEXT NOT NULL, PRIMARY KEY (root, pos))""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS playlist_history (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT, root TEXT NOT NULL, id TEXT NOT NULL)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS weights (
+                id TEXT PRIMARY KEY, weight REAL NOT NULL)""")
+            row = self._db.execute("SELECT current FROM playlist_state WHERE root = ?",
+                                   (self.key,)).fetchone()
+            self.current = row[0] if row else None
+            self.bag = [row[0] for row in self._db.execute(
+                "SELECT id FROM playlist_bag WHERE root = ? ORDER BY pos", (self.key,))]
+            self.history = deque((row[0] for row in self._db.execute(
+                "SELECT id FROM playlist_history WHERE root = ? ORDER BY seq DESC LIMIT ?",
+                (self.key, self.HISTORY_LIMIT))), maxlen=self.HISTORY_LIMIT)
+            self.history.reverse()
+            if library.weights is None:
+                library.weights = dict(self._db.execute("SELECT id, weight FROM weights"))
+            self.weights = library.weights
+        self.queue = []
+        self.position = {}  # wallpaper_id -> index in self.queue
+        self.reload()
+    
+    def reload(self):
+        """Re-read the queue order after the library changed"""
+        queue = self.library.ids()
+        with self._lock:
+            self.queue = queue
+            self.position = {wallpaper_id: index for index, wallpaper_id in enumerate(queue)}
+    
+    def _set_current(self, wallpaper_id, remember=True):
+        with self._lock, self.library._lock, self._db:
+            if remember and self.current and self.current != wallpaper_id:
+                self.history.append(self.current)
+                self._db.execute("INSERT INTO playlist_history (root, id) VALUES (?, ?)",
+                                 (self.key, self.current))
+                if len(self.history) == self.HISTORY_LIMIT:
+                    self._db.execute("""DELETE FROM playlist_history WHERE root = ? AND seq <=
+                        (SELECT seq FROM playlist_history WHERE root = ? ORDER BY seq DESC
+                         LIMIT 1 OFFSET ?)""", (self.key, self.key, self.HISTORY_LIMIT))
+            self.current = wallpaper_id
+            self._db.execute("INSERT OR REPLACE INTO playlist_state VALUES (?, ?)",
+                             (self.key, wallpaper_id))
+        return wallpaper_id
+    
+    def select(self, wallpaper_id):
+        """Record an explicit pick from the grid"""
+        return self._set_current(wallpaper_id)
+    
+    def _sequential(self, delta, allowed=None):
+        if not self.queue:
+            return None
+        index = self.position.get(self.current, -1 if delta > 0 else 0)
+        if allowed is None:
+            return self.queue[(index + delta) % len(self.queue)]
+        direction = 1 if delta > 0 else -1
+        remaining = abs(delta)
+        for _ in range(len(self.queue) * remaining):
+            index = (index + direction) % len(self.queue)
+            if self.queue[index] in allowed:
+                remaining -= 1
+                if not remaining:
+                    return self.queue[index]
+        return None
+    
+    def next(self, delta=1, allowed=None):
+        """Move delta places along the queue, counting only allowed wallpapers"""
+        with self._lock:
+            wallpaper_id = self._sequential(delta, allowed)
+            return self._set_current(wallpaper_id) if wallpaper_id else None
+    
+    def back(self, steps=1, allowed=None):
+        """Go back through the history, then along the queue once it runs out"""
+        with self._lock:
+            wallpaper_id, popped = None, 0
+            while popped < steps and self.history:
+                candidate = self.history.pop()
+                popped += 1
+                if candidate in self.position:
+                    wallpaper_id = candidate
+            if popped:
+                with self.library._lock, self._db:
+                    self._db.execute("""DELETE FROM playlist_history WHERE seq IN (SELECT seq
+                        FROM playlist_history WHERE root = ? ORDER BY seq DESC LIMIT ?)""",
+                                     (self.key, popped))
+            if popped < steps or wallpaper_id is None:
+                wallpaper_id = self._sequential(-(steps - popped) or -1, allowed)
+            return self._set_current(wallpaper_id, remember=False) if wallpaper_id else None
+    
+    def weight(self, wallpaper_id):
+        return self.weights.get(wallpaper_id, 1.0)
+    
+    def set_weight(self, wallpaper_id, weight):
+        """Relative chance of being drawn early from a fresh shuffle bag; 1.0 is the default"""
+        with self._lock:
+            if weight == 1.0:
+                self.weights.pop(wallpaper_id, None)
+            else:
+                self.weights[wallpaper_id] = weight
+            with self.library._lock, self._db:
+                if weight == 1.0:
+                    self._db.execute("DELETE FROM weights WHERE id = ?", (wallpaper_id,))
+                else:
+                    self._db.execute("INSERT OR REPLACE INTO weights VALUES (?, ?)", (wallpaper_id, weight))
+    
+    def is_favorite(self, wallpaper_id):
+        return self.weight(wallpaper_id) > 1.0
+    
+    def toggle_favorite(self, wallpaper_id):
+        favorite = not self.is_favorite(wallpaper_id)
+        self.set_weight(wallpaper_id, self.FAVORITE_WEIGHT if favorite else 1.0)
+        return favorite
+    
+    def _refill(self):
+        """Weighted random permutation of the queue (Efraimidis-Spirakis keys)"""
+        keyed = [(random.random() ** (1.0 / max(self.weight(w), 1e-6)), w)
+                 for w in self.queue if w != self.current]
+        keyed.sort()  # Ascending, since the bag is popped from the end: heavier draws come first
+        self.bag = [wallpaper_id for _, wallpaper_id in keyed]
+        with self.library._lock, self._db:
+            self._db.execute("DELETE FROM playlist_bag WHERE root = ?", (self.key,))
+            self._db.executemany("INSERT INTO playlist_bag VALUES (?, ?, ?)",
+                                 ((self.key, pos, w) for pos, w in enumerate(self.bag)))
+    
+    def _draw(self, allowed=None):
+        """Pop the bag until an allowed wallpaper comes up; skipped ones sit out this bag"""
+        for attempt in range(2):
+            while self.bag:
+                wallpaper_id = self.bag.pop()
+                if wallpaper_id in self.position and (allowed is None or wallpaper_id in allowed):
+                    with self.library._lock, self._db:
+                        self._db.execute("DELETE FROM playlist_bag WHERE root = ? AND pos >= ?",
+                                         (self.key, len(self.bag)))
+                    return wallpaper_id
+            if attempt == 0:
+                self._refill()
+        return None
+    
+    def shuffle(self, allowed=None):
+        """Next wallpaper from the shuffle bag, refilling it once every entry was shown"""
+        with self._lock:
+            wallpaper_id = self._draw(allowed)
+            return self._set_current(wallpaper_id) if wallpaper_id else None
+    
+    def peek(self, allowed=None):
+        """Wallpaper a sequential step would load, without moving"""
+        with self._lock:
+            return self._sequential(1, allowed)
+
+class SearchIndex:
+    """In-memory prefix index over wallpaper IDs, titles, types and tags"""
+    def __init__(self):
+        self._postings = {}  # token -> set of wallpaper_ids
+        self._documents = {}  # wallpaper_id -> set of tokens
+        self._tokens = []
+        self._tokens_dirty = False
+        self._last_query = ""
+        self._last_result = None
+    
+    @staticmethod
+    def tokenize(text):
+        return re.findall(r"\w+", (text or "").lower())
+    
+    def add(self, wallpaper_id, *fields):
+        self.remove(wallpaper_id)
+        tokens = {wallpaper_id.lower()}
+        for field in fields:
+            tokens.update(self.tokenize(field))
+        self._documents[wallpaper_id] = tokens
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                self._tokens_dirty = True
+            postings.add(wallpaper_id)
+        self._last_result = None
+    
+    def remove(self, wallpaper_id):
+        for token in self._documents.pop(wallpaper_id, ()):
+            postings = self._postings[token]
+            postings.discard(wallpaper_id)
+            if not postings:
+                del self._postings[token]
+                self._tokens_dirty = True
+        self._last_result = None
+    
+    def _prefix(self, term):
+        if self._tokens_dirty:
+            self._tokens = sorted(self._postings)
+            self._tokens_dirty = False
+        matches = set()
+        index = bisect.bisect_left(self._tokens, term)
+        while index < len(self._tokens) and self._tokens[index].startswith(term):
+            matches |= self._postings[self._tokens[index]]
+            index += 1
+        return matches
+    
+    def search(self, query):
+        """Matching wallpaper_ids, or None when the query is empty"""
+        terms = self.tokenize(query)
+        if not terms:
+            self._last_query, self._last_result = "", None
+            return None
+        
+        result = self._last_result
+        if result is None or not self._last_query or not query.startswith(self._last_query):
+            result = None
+        for term in terms:
+            matches = self._prefix(term)
+            # Intersect smallest-first; when narrowing, start from the previous hits
+            result = matches if result is None else (result & matches if len(result) < len(matches)
+                                                     else matches & result)
+            if not result:
+                break
+        
+        self._last_query, self._last_result = query, result
+        return result
+
+class CostProfiler:
+    """Samples running engines' CPU time and RSS from /proc into per-wallpaper costs"""
+    SAMPLE_SECONDS = 5
+    WARMUP_SECONDS = 10
+    
+    def __init__(self, engines, on_update=None, proc_root="/proc"):
+        self.engines = engines
+        self.on_update = on_update
+        self.proc_root = Path(proc_root)
+        self.ticks_per_second = os.sysconf("SC_CLK_TCK")
+        self._last = {}  # output -> (pid, wallpaper_id, cpu_ticks, monotonic time)
+        self._started = {}  # output -> when its current wallpaper was first sampled
+        self._timer = GLib.timeout_add_seconds(self.SAMPLE_SECONDS, self._sample)
+    
+    def read(self, pid):
+        """(utime + stime in clock ticks, RSS bytes) for pid, or None if it is gone"""
+        try:
+            stat = (self.proc_root / str(pid) / "stat").read_text()
+            # Fields after the parenthesized comm: state is [0], utime [11], stime [12]
+            fields = stat[stat.rindex(")") + 2:].split()
+            ticks = int(fields[11]) + int(fields[12])
+            rss = EngineController._read_kib(self.proc_root / str(pid) / "status", "VmRSS")
+        except (OSError, ValueError, IndexError):
+            return None
+        return ticks, rss or 0
+    
+    def _sample(self):
+        for engine in self.engines:
+            self._sample_engine(engine)
+        return True
+    
+    def _sample_engine(self, engine):
+        output = engine.output
+        process, wallpaper_id, library = engine.process, engine.current, engine.library
+        sample = None
+        if process is not None and wallpaper_id is not None and library is not None:
+            sample = self.read(process.pid)
+        if sample is None:
+            self._last.pop(output, None)
+            return
+        
+        ticks, rss = sample
+        now = time.monotonic()
+        last = self._last.get(output)
+        if last and last[:2] == (process.pid, wallpaper_id):
+            if now - self._started[output] >= self.WARMUP_SECONDS:
+                cpu = (ticks - last[2]) / self.ticks_per_second / (now - last[3]) * 100
+                cost = library.record_cost(wallpaper_id, cpu, rss)
+                if cost is not None and self.on_update:
+                    self.on_update(wallpaper_id, cost)
+        else:
+            self._started[output] = now
+        self._last[output] = (process.pid, wallpaper_id, ticks, now)
+    
+    def stop(self):
+        if self._timer:
+            GLib.source_remove(self._timer)
+            self._timer = 0
+
+class PowerMonitor:
+    """AC/battery state from /sys/class/power_supply; root is injectable for a fake sysfs tree"""
+    AC_TYPES = ("Mains", "USB", "USB_C", "USB_PD")
+    
+    def __init__(self, root="/sys/class/power_supply"):
+        self.root = Path(root)
+    
+    @staticmethod
+    def _read(supply, name):
+        try:
+            return (supply / name).read_text().strip()
+        except OSError:
+            return None
+    
+    def on_battery(self):
+        try:
+            supplies = list(self.root.iterdir())
+        except OSError:
+            return False
+        discharging = False
+        for supply in supplies:
+            kind = self._read(supply, "type")
+            if kind in self.AC_TYPES and self._read(supply, "online") == "1":
+                return False
+            # scope=Device marks peripherals such as wireless mice
+            if (kind == "Battery" and self._read(supply, "scope") != "Device" and
+                    self._read(supply, "status") == "Discharging"):
+                discharging = True
+        return discharging
+
+class SessionMonitor:
+    """Whether the session is locked or idle, from the screensaver's D-Bus API"""
+    SCREENSAVERS = (("org.cinnamon.ScreenSaver", "/org/cinnamon/ScreenSaver"),
+                    ("org.gnome.ScreenSaver", "/org/gnome/ScreenSaver"),
+                    ("org.freedesktop.ScreenSaver", "/org/freedesktop/ScreenSaver"))
+    
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self.active = False
+        self.log = logging.getLogger('SessionMonitor')
+        self._proxy = None
+        try:
+            bus = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+        except GLib.Error as e:
+            self.log.warning(f"No session bus, idle/lock detection disabled: {e}")
+            return
+        
+        for name, path in self.SCREENSAVERS:
+            try:
+                proxy = Gio.DBusProxy.new_sync(bus, Gio.DBusProxyFlags.DO_NOT_LOAD_PROPERTIES,
+                                               None, name, path, name, None)
+            except GLib.Error:
+                continue
+            if proxy.get_name_owner() is None:
+                continue
+            try:
+                self.active = bool(proxy.call_sync("GetActive", None, Gio.DBusCallFlags.NONE,
+                                                   1000, None).unpack()[0])
+            except GLib.Error:
+                continue
+            proxy.connect("g-signal", self._on_signal)
+            self._proxy = proxy
+            self.log.info(f"Watching {name}")
+            break
+    
+    def _on_signal(self, proxy, sender, signal_name, parameters):
+        if signal_name == "ActiveChanged":
+            self.active = bool(parameters.unpack()[0])
+            if self.on_change:
+                self.on_change(self.active)
+
+class ShuffleScheduler:
+    """Shuffles on a GLib timer, pausing while locked or idle and throttling on battery"""
+    POWER_POLL_SECONDS = 60
+    BATTERY_INTERVAL_FACTOR = 2
+    
+    def __init__(self, settings_store, commands, engine, power=None, session=None):
+        self.settings = settings_store
+        self.commands = commands
+        self.engine = engine
+        self.log = logging.getLogger('ShuffleScheduler')
+        self.power = power or PowerMonitor()
+        self.on_battery = self.power.on_battery()
+        self._timer = 0
+        self._deadline = None
+        self._remaining = None  # Seconds left when the timer was paused
+        self._power_poll = GLib.timeout_add_seconds(self.POWER_POLL_SECONDS, self._poll_power)
+        self.session = session or SessionMonitor()
+        self.session.on_change = self.on_session_changed
+        self.apply_power(restart=False)
+        self.reconfigure()
+    
+    def interval(self):
+        seconds = int(self.settings.get("shuffleInterval", 10)) * 60
+        if self.on_battery and self.settings.get("batterySaver", True):
+            seconds *= self.BATTERY_INTERVAL_FACTOR
+        return seconds
+    
+    def _schedule(self, seconds):
+        if self._timer:
+            GLib.source_remove(self._timer)
+        self._deadline = time.monotonic() + seconds
+        self._timer = GLib.timeout_add_seconds(max(1, int(seconds)), self._on_timer)
+    
+    def _cancel(self):
+        if self._timer:
+            GLib.source_remove(self._timer)
+            self._timer = 0
+        self._deadline = None
+    
+    def reconfigure(self):
+        """Restart the countdown from the current interval settings"""
+        self._cancel()
+        self._remaining = None
+        if not self.settings.get("shuffleEnabled", False):
+            return
+        if self.session.active:
+            self._remaining = self.interval()
+        else:
+            self._schedule(self.interval())
+    
+    def apply_settings(self, changed_keys):
+        if changed_keys & {"batterySaver", "batteryMaxFps", "batteryMaxCpuPercent"}:
+            self.apply_power()
+        if changed_keys & {"shuffleEnabled", "shuffleInterval", "batterySaver"}:
+            self.reconfigure()
+    
+    def _on_timer(self):
+        self._timer = 0
+        self.log.info("Shuffle timer fired")
+        # Same as the applet's timer: advance to the next wallpaper in the queue
+        self.commands.step(1)
+        self._schedule(self.interval())
+        return False
+    
+    def on_session_changed(self, active):
+        if not self.settings.get("shuffleEnabled", False):
+            return
+        if active and self._deadline is not None:
+            self._remaining = max(0, self._deadline - time.monotonic())
+            self._cancel()
+            self.log.info(f"Session idle or locked, pausing with {self._remaining:.0f}s left")
+        elif not active and self._remaining is not None:
+            self._schedule(self._remaining)
+            self._remaining = None
+    
+    def _poll_power(self):
+        on_battery = self.power.on_battery()
+        if on_battery != self.on_battery:
+            self.on_battery = on_battery
+            self.log.info(f"Now on {'battery' if on_battery else 'AC power'}")
+            self.apply_power()
+            if self._deadline is not None:
+                self._schedule(min(self.interval(), self._deadline - time.monotonic()))
+        return True
+    
+    def apply_power(self, restart=True):
+        """Cap the engine FPS while on battery; restarts the engine when the cap changes"""
+        cap = None
+        self.engine.cpu_cap = None
+        if self.on_battery and self.settings.get("batterySaver", True):
+            # Clamped so a bad file value lowers the limit instead of dropping --fps
+            cap = self.settings.get_clamped("batteryMaxFps", 15)
+            self.engine.cpu_cap = self.settings.get_clamped("batteryMaxCpuPercent", 15)
+        if cap != self.engine.fps_cap:
+            self.engine.fps_cap = cap
+            if restart:
+                self.commands.restart()
+    
+    def stop(self):
+        self._cancel()
+        if self._power_poll:
+            GLib.source_remove(self._power_poll)
+            self._power_poll = 0
+
+class CommandQueue:
+    """Runs engine commands one at a time on a worker thread, coalescing the ones still waiting"""
+    def __init__(self, engine, on_done=None):
+        self.engine = engine
+        self.on_done = on_done
+        self.log = logging.getLogger('CommandQueue')
+        self.busy = False
+        self._pending = []  # [kind, args, callbacks], oldest first
+        self._closed = False
+        self._cond = threading.Condition()
+        
+        thread = threading.Thread(target=self._worker)
+        thread.daemon = True
+        thread.start()
+    
+    def submit(self, kind, *args, callback=None):
+        callbacks = [callback] if callback else []
+        with self._cond:
+            pending = self._pending
+            last = pending[-1][0] if pending else None
+            if self._closed or (last == "stop" and kind != "stop"):
+                self._supersede(callbacks)  # Stop is final
+                return
+            if kind == "stop":
+                if last == "stop":
+                    pending[-1][2] += callbacks
+                    return
+                self._drop_pending()
+            elif kind == "restart":
+                if last in ("load", "random", "restart"):
+                    pending[-1][2] += callbacks  # These start the engine with current settings anyway
+                    TRACER.count("commands coalesced")
+                    return
+            elif kind == "step":
+                if last == "step":
+                    pending[-1][1] = (pending[-1][1][0] + args[0],)
+                    pending[-1][2] += callbacks
+                    TRACER.count("commands coalesced")
+                    return
+                if last == "restart":
+                    # The step starts the engine with current settings anyway
+                    callbacks = pending.pop()[2] + callbacks
+            else:
+                self._drop_pending()
+            pending.append([kind, args, callbacks])
+            self._cond.notify()
+    
+    def step(self, delta, callback=None):
+        self.submit("step", delta, callback=callback)
+    
+    def load(self, wallpaper_id=None, callback=None):
+        self.submit("load", wallpaper_id, callback=callback)
+    
+    def random(self, callback=None):
+        self.submit("random", callback=callback)
+    
+    def restart(self, callback=None):
+        self.submit("restart", callback=callback)
+    
+    def stop(self, callback=None):
+        self.submit("stop", callback=callback)
+    
+    def cancel(self):
+        """Drop the commands still waiting; the running one completes"""
+        with self._cond:
+            self._drop_pending()
+    
+    def _drop_pending(self):
+        for _, _, callbacks in self._pending:
+            self._supersede(callbacks)
+        self._pending.clear()
+    
+    def _supersede(self, callbacks):
+        if callbacks:
+            TRACER.count("commands superseded")
+            GLib.idle_add(self._finish_callbacks, callbacks, None)
+    
+    def close(self):
+        """Refuse new commands and end the worker thread once the pending ones have run"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+    
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                kind, args, callbacks = self._pending.pop(0)
+                self.busy = True
             
-            if result.returncode != 0:
-                if parent_window:
-                    self.log.error(f"Script error: {result.stderr}")
-                    parent_window.status_label.set_text(f"Error: {result.stderr}")
+            if kind == "step" and args[0] == 0:
+                ok = True  # Presses cancelled each other out
+            else:
+                try:
+                    ok = getattr(self.engine, kind)(*args) is not False
+                except Exception as e:
+                    self.log.error(f"Command {kind} failed: {e}", exc_info=True)
+                    ok = False
             
-            return result
+            with self._cond:
+                self.busy = bool(self._pending)
+            GLib.idle_add(self._finish, kind, ok, callbacks)
+    
+    def _finish(self, kind, ok, callbacks):
+        if self.on_done:
+            self.on_done(kind, ok)
+        return self._finish_callbacks(callbacks, ok)
+    
+    @staticmethod
+    def _finish_callbacks(callbacks, ok):
+        for callback in callbacks:
+            callback(ok)
+        return False
+
+class EngineSupervisor:
+    """One EngineController and CommandQueue per enabled output"""
+    SUPERVISE_SECONDS = 10
+    RESTART_BACKOFF = 60
+    
+    def __init__(self, settings_store, detector=None, executable=None, on_done=None):
+        self.settings = settings_store
+        self.detector = detector or OutputDetector()
+        self.executable = executable
+        self.on_done = on_done
+        self.log = logging.getLogger('EngineSupervisor')
+        self.library = None
+        self.engines = OrderedDict()  # output name, or None in single-engine mode -> EngineController
+        self.queues = {}
+        self._fps_cap = None
+        self._cpu_cap = None
+        self._restarted = {}  # output -> monotonic time of the last automatic restart
+        self.sync(start=False)
+        self._timer = GLib.timeout_add_seconds(self.SUPERVISE_SECONDS, self._supervise)
+    
+    def enabled_outputs(self):
+        outputs = [name.strip() for name in str(self.settings.get("outputs", "") or "").split(",")]
+        return [name for name in outputs if name] or [None]
+    
+    def sync(self, start=True):
+        """Stop engines on outputs that were disabled and start newly enabled ones"""
+        wanted = self.enabled_outputs()
+        for output in [output for output in self.engines if output not in wanted]:
+            del self.engines[output]
+            command_queue = self.queues.pop(output)
+            command_queue.stop()
+            command_queue.close()
+            self.log.info(f"Stopping engine on {output or 'the default output'}")
+        
+        engines = OrderedDict()
+        for output in wanted:
+            engine = self.engines.get(output)
+            if engine is None:
+                engine = EngineController(self.settings, library=self.library, executable=self.executable,
+                                          output=output, detector=self.detector)
+                engine.fps_cap, engine.cpu_cap = self._fps_cap, self._cpu_cap
+                self.queues[output] = CommandQueue(engine, on_done=self.on_done)
+                if start:
+                    self.queues[output].load()
+            engine.primary = output == wanted[0]
+            engines[output] = engine
+        self.engines = engines
+    
+    @property
+    def primary(self):
+        return next(iter(self.engines.values()))
+    
+    def __iter__(self):
+        return iter(list(self.engines.values()))
+    
+    def attach_library(self, library):
+        self.library = library
+        for engine in self:
+            engine.attach_library(library)
+    
+    def reload_playlists(self):
+        for engine in self:
+            if engine.playlist is not None:
+                engine.playlist.reload()
+    
+    @property
+    def fps_cap(self):
+        return self._fps_cap
+    
+    @fps_cap.setter
+    def fps_cap(self, cap):
+        self._fps_cap = cap
+        for engine in self:
+            engine.fps_cap = cap
+    
+    @property
+    def cpu_cap(self):
+        return self._cpu_cap
+    
+    @cpu_cap.setter
+    def cpu_cap(self, cap):
+        self._cpu_cap = cap
+        for engine in self:
+            engine.cpu_cap = cap
+    
+    @property
+    def busy(self):
+        return any(command_queue.busy for command_queue in list(self.queues.values()))
+    
+    def _targets(self, output):
+        if output is not None and output in self.queues:
+            return [self.queues[output]]
+        return list(self.queues.values())
+    
+    @staticmethod
+    def _join(callback, count):
+        """Call callback once every target has reported: None if all were superseded, else all ok"""
+        if callback is None:
+            return None
+        results = []
+        
+        def done(ok):
+            results.append(ok)
+            if len(results) == count:
+                ran = [result for result in results if result is not None]
+                callback(all(ran) if ran else None)
+        return done
+    
+    def _submit(self, kind, *args, output=None, callback=None):
+        targets = self._targets(output)
+        callback = self._join(callback, len(targets))
+        for command_queue in targets:
+            command_queue.submit(kind, *args, callback=callback)
+    
+    def step(self, delta, output=None, callback=None):
+        self._submit("step", delta, output=output, callback=callback)
+    
+    def load(self, wallpaper_id=None, output=None, callback=None):
+        self._submit("load", wallpaper_id, output=output, callback=callback)
+    
+    def random(self, output=None, callback=None):
+        self._submit("random", output=output, callback=callback)
+    
+    def restart(self, output=None, callback=None):
+        self._submit("restart", output=output, callback=callback)
+    
+    def stop(self, output=None, callback=None):
+        self._submit("stop", output=output, callback=callback)
+    
+    def cancel(self):
+        for command_queue in self._targets(None):
+            command_queue.cancel()
+    
+    def close(self):
+        """Stop supervising and refuse further commands, e.g. once exit has queued its stop"""
+        if self._timer:
+            GLib.source_remove(self._timer)
+            self._timer = 0
+        for command_queue in self._targets(None):
+            command_queue.close()
+    
+    def apply_settings(self, changed_keys):
+        """Restart only the engines a batch of settings changes affects"""
+        if "outputs" in changed_keys:
+            self.sync()
+        engine_keys = changed_keys & SettingsStore.ENGINE_KEYS
+        if engine_keys - {"screenRoot"}:
+            self.restart()
+        elif engine_keys and None in self.queues:
+            # screenRoot only matters to the single-engine mode
+            self.queues[None].restart()
+    
+    def _supervise(self):
+        now = time.monotonic()
+        for output, engine in list(self.engines.items()):
+            process = engine.process
+            if process is None or process.poll() is None or self.queues[output].busy:
+                continue
+            if now - self._restarted.get(output, -self.RESTART_BACKOFF) < self.RESTART_BACKOFF:
+                continue
+            self._restarted[output] = now
+            self.log.warning(f"Engine on {output or 'the default output'} exited with "
+                             f"{process.returncode}, restarting it")
+            self.queues[output].load(engine.current)
+        return True
+
+class ControlService:
+    """Engine control exported on the session bus for the applet and wallpaper-manager.sh"""
+    BUS_NAME = "io.github.abcdqfr.WallpaperShuffle"
+    OBJECT_PATH = "/io/github/abcdqfr/WallpaperShuffle"
+    INTERFACE_XML = """
+    <node>
+      <interface name="io.github.abcdqfr.WallpaperShuffle">
+        <method name="Next"/>
+        <method name="Prev"/>
+        <method name="Random"/>
+        <method name="Load">
+          <arg type="s" name="wallpaper_id" direction="in"/>
+        </method>
+        <method name="Stop"/>
+        <method name="SetSetting">
+          <arg type="s" name="key" direction="in"/>
+          <arg type="s" name="value" direction="in"/>
+        </method>
+        <method name="GetState">
+          <arg type="a{ss}" name="state" direction="out"/>
+        </method>
+        <signal name="StateChanged">
+          <arg type="s" name="command"/>
+          <arg type="b" name="ok"/>
+          <arg type="a{ss}" name="state"/>
+        </signal>
+      </interface>
+    </node>
+    """
+    
+    def __init__(self, settings_store, engines, replaceable=False, on_name_lost=None):
+        self.settings = settings_store
+        self.engines = engines
+        self.on_name_lost = on_name_lost
+        self.log = logging.getLogger('ControlService')
+        self.interface = Gio.DBusNodeInfo.new_for_xml(self.INTERFACE_XML).interfaces[0]
+        self.connection = None
+        self._registration = 0
+        flags = Gio.BusNameOwnerFlags.ALLOW_REPLACEMENT if replaceable else Gio.BusNameOwnerFlags.REPLACE
+        self._owner = Gio.bus_own_name(Gio.BusType.SESSION, self.BUS_NAME, flags,
+                                       self._on_bus_acquired, self._on_name_acquired, self._on_name_lost)
+    
+    def _on_bus_acquired(self, connection, name):
+        self.connection = connection
+        self._registration = connection.register_object(self.OBJECT_PATH, self.interface,
+                                                        self._on_method_call, None, None)
+    
+    def _on_name_acquired(self, connection, name):
+        self.log.info(f"Serving {name} on the session bus")
+    
+    def _on_name_lost(self, connection, name):
+        self.log.info(f"Not serving {name}: another instance owns it")
+        self._unregister()
+        if self.on_name_lost:
+            self.on_name_lost()
+    
+    def _unregister(self):
+        if self._registration and self.connection is not None:
+            self.connection.unregister_object(self._registration)
+        self._registration = 0
+    
+    def _on_method_call(self, connection, sender, object_path, interface_name, method_name,
+                        parameters, invocation):
+        args = parameters.unpack()
+        
+        def reply(ok):
+            if ok:
+                invocation.return_value(None)
+            elif ok is None:
+                invocation.return_dbus_error(f"{self.BUS_NAME}.Error.Superseded",
+                                             f"{method_name} was replaced by a later command before it ran")
+            else:
+                invocation.return_dbus_error(f"{self.BUS_NAME}.Error.Failed", f"{method_name} failed")
+        
+        if method_name == "Next":
+            self.engines.step(1, callback=reply)
+        elif method_name == "Prev":
+            self.engines.step(-1, callback=reply)
+        elif method_name == "Random":
+            self.engines.random(callback=reply)
+        elif method_name == "Load":
+            self.engines.load(args[0] or None, callback=reply)
+        elif method_name == "Stop":
+            self.engines.stop(callback=reply)
+        elif method_name == "SetSetting":
+            key, value = args
+            try:
+                self.settings.coerce(key, value)
+            except ValueError as e:
+                invocation.return_dbus_error(f"{self.BUS_NAME}.Error.InvalidSetting", str(e))
+                return
+            # Left to the debounce, so a client setting several keys causes one restart
+            self.settings.set(key, value)
+            invocation.return_value(None)
+        elif method_name == "GetState":
+            invocation.return_value(GLib.Variant("(a{ss})", (self.state(),)))
+        else:
+            invocation.return_dbus_error("org.freedesktop.DBus.Error.UnknownMethod", method_name)
+    
+    def state(self):
+        """currentWallpaper plus current:<output> for every enabled output"""
+        engines = list(self.engines)
+        state = {"currentWallpaper": (engines[0].current or "") if engines else ""}
+        for engine in engines:
+            if engine.output is not None:
+                state[f"current:{engine.output}"] = engine.current or ""
+        return state
+    
+    def emit_state(self, command, ok):
+        if self.connection is None or not self._registration:
+            return
+        try:
+            self.connection.emit_signal(None, self.OBJECT_PATH, self.BUS_NAME, "StateChanged",
+                                        GLib.Variant("(sba{ss})", (command, ok, self.state())))
+        except GLib.Error as e:
+            self.log.warning(f"Failed to emit StateChanged: {e}")
+    
+    def close(self):
+        self._unregister()
+        if self._owner:
+            Gio.bus_unown_name(self._owner)
+            self._owner = 0
+
+class PreviewDecoder:
+    """Streams a preview through GdkPixbuf.PixbufLoader, decoding only what a thumbnail needs"""
+    CHUNK = 256 * 1024
+    SIGNATURES = ((b"\xff\xd8\xff", "jpeg"), (b"\x89PNG\r\n\x1a\n", "png"),
+                  (b"GIF87a", "gif"), (b"GIF89a", "gif"))
+    
+    @classmethod
+    def sniff(cls, header):
+        for magic, fmt in cls.SIGNATURES:
+            if header.startswith(magic):
+                return fmt
+        return None
+    
+    @staticmethod
+    def fit(width, height, size):
+        """Dimensions of width x height scaled to fit a size x size box"""
+        scale = min(size / width, size / height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    
+    @staticmethod
+    def gif_first_frame_end(data):
+        """Offset just past the first image's data blocks, or None if the GIF is malformed"""
+        try:
+            flags = data[10]
+            pos = 13 + (3 << ((flags & 7) + 1) if flags & 0x80 else 0)  # Global color table
+            while True:
+                block = data[pos]
+                if block == 0x21:  # Extension introducer and label
+                    pos += 2
+                elif block == 0x2C:  # Image descriptor, local color table, LZW code size
+                    flags = data[pos + 9]
+                    pos += 10 + (3 << ((flags & 7) + 1) if flags & 0x80 else 0) + 1
+                else:
+                    return None  # Trailer before any image, or garbage
+                while data[pos]:  # Data sub-blocks up to the zero-length terminator
+                    pos += data[pos] + 1
+                pos += 1
+                if block == 0x2C:
+                    return pos
+        except IndexError:
+            return None
+    
+    @staticmethod
+    def _on_size_prepared(loader, width, height, size):
+        scaled = PreviewDecoder.fit(width, height, size)
+        if scaled != (width, height):
+            loader.set_size(*scaled)
+    
+    @classmethod
+    def decode(cls, path, size):
+        """Pixbuf of the preview scaled to fit size x size, aspect ratio kept"""
+        with TRACER.span("decode", path=path) as span:
+            with open(path, "rb") as f:
+                length = os.fstat(f.fileno()).st_size
+                if not length:
+                    raise OSError(f"Empty preview: {path}")
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    fmt = cls.sniff(data[:8])
+                    end, trailer = length, b""
+                    if fmt == "gif":
+                        first_frame = cls.gif_first_frame_end(data)
+                        if first_frame is not None:
+                            end, trailer = first_frame, b"\x3B"
+                
+                    span.set(format=fmt or "", bytes=end)
+                    loader = GdkPixbuf.PixbufLoader.new_with_type(fmt) if fmt else GdkPixbuf.PixbufLoader()
+                    loader.connect("size-prepared", cls._on_size_prepared, size)
+                    closed = False
+                    try:
+                        for start in range(0, end, cls.CHUNK):
+                            loader.write(data[start:min(start + cls.CHUNK, end)])
+                        if trailer:
+                            loader.write(trailer)
+                        closed = True
+                        loader.close()
+                    finally:
+                        if not closed:
+                            try:
+                                loader.close()
+                            except GLib.Error:
+                                pass
             
-        except Exception as e:
-            self.log.error(f"Failed to run script: {e}")
-            if parent_window and hasattr(parent_window, 'status_label'):
-                parent_window.status_label.set_text(f"Error: {str(e)}")
+            pixbuf = loader.get_pixbuf()
+            if pixbuf is None:
+                raise GLib.Error(f"No image data in {path}")
+            # Some loaders (GIF among them) ignore set_size
+            width, height = cls.fit(pixbuf.get_width(), pixbuf.get_height(), size)
+            if (width, height) != (pixbuf.get_width(), pixbuf.get_height()):
+                pixbuf = pixbuf.scale_simple(width, height, GdkPixbuf.InterpType.BILINEAR)
+            return pixbuf
+
+class ThumbnailCache:
+    """On-disk preview thumbnails, laid out like the freedesktop ~/.cache/thumbnails spec"""
+    SIZE = 200
+
+    def __init__(self, cache_dir=None, max_bytes=256 * 1024 * 1024):
+        if cache_dir is None:
+            cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+            cache_dir = os.path.join(cache_home, "wallpaper-shuffle", "thumbnails")
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.log = logging.getLogger('ThumbnailCache')
+        self._lock = threading.Lock()
+        self._total = None  # Bytes on disk, computed on first store
+    
+    def _thumb_path(self, preview_path):
+        uri = Path(preview_path).absolute().as_uri()
+        return self.cache_dir / f"{hashlib.md5(uri.encode()).hexdigest()}.png"
+    
+    def lookup(self, preview_path, wallpaper_id):
+        """Return the cached thumbnail, or None if missing or stale"""
+        thumb_path = self._thumb_path(preview_path)
+        try:
+            st = os.stat(preview_path)
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file(str(thumb_path))
+        except (OSError, GLib.Error):
+            TRACER.count("thumbnail miss")
+            return None
+        
+        if (pixbuf.get_option("tEXt::Thumb::MTime") != str(int(st.st_mtime)) or
+                pixbuf.get_option("tEXt::Thumb::Size") != str(st.st_size) or
+                pixbuf.get_option("tEXt::X-Wallpaper-Id") != str(wallpaper_id)):
+            TRACER.count("thumbnail stale")
+            return None
+        TRACER.count("thumbnail hit")
+        
+        try:
+            os.utime(thumb_path)  # Thumbnail mtime doubles as the LRU timestamp
+        except OSError:
+            pass
+        return pixbuf
+    
+    def store(self, preview_path, wallpaper_id, pixbuf):
+        """Write a thumbnail atomically, then evict old entries if over budget"""
+        thumb_path = self._thumb_path(preview_path)
+        tmp_path = thumb_path.with_name(f"{thumb_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            st = os.stat(preview_path)
+            self.cache_dir.mkdir(parents=True, exist_ok=True, mode=0o700)
+            pixbuf.savev(str(tmp_path), "png",
+                ["tEXt::Thumb::URI", "tEXt::Thumb::MTime", "tEXt::Thumb::Size", "tEXt::X-Wallpaper-Id"],
+                [Path(preview_path).absolute().as_uri(), str(int(st.st_mtime)), str(st.st_size), str(wallpaper_id)])
+            size = tmp_path.stat().st_size
+            os.replace(tmp_path, thumb_path)
+        except (OSError, GLib.Error) as e:
+            self.log.warning(f"Failed to cache thumbnail for {wallpaper_id}: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return
+        
+        with self._lock:
+            if self._total is None:
+                self._total = self._disk_usage()
+            else:
+                self._total += size
+            if self._total > self.max_bytes:
+                self._evict()
+    
+    @classmethod
+    def decode(cls, preview_path):
+        """Decode a preview at thumbnail size (GIFs yield their first frame)"""
+        return PreviewDecoder.decode(preview_path, cls.SIZE)
+    
+    def load(self, preview_path, wallpaper_id):
+        """Return the thumbnail, decoding and caching the preview on a miss"""
+        pixbuf = self.lookup(preview_path, wallpaper_id)
+        if pixbuf is None:
+            pixbuf = self.decode(preview_path)
+            self.store(preview_path, wallpaper_id, pixbuf)
+        return pixbuf
+    
+    def _entries(self):
+        try:
+            with os.scandir(self.cache_dir) as it:
+                return [(e.stat().st_mtime, e.stat().st_size, e.path)
+                        for e in it if e.name.endswith(".png") and e.is_file()]
+        except OSError:
+            return []
+    
+    def _disk_usage(self):
+        return sum(size for _, size, _ in self._entries())
+    
+    def _evict(self):
+        """Drop least recently used thumbnails until 90% of the budget is free"""
+        try:
+            lock = open(self.cache_dir / ".lock", "a")
+        except OSError as e:
+            self.log.warning(f"Failed to open thumbnail cache lock: {e}")
+            return
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # Another process is trimming; the next store checks again
+            target = self.max_bytes * 0.9
+            entries = sorted(self._entries())
+            self._total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if self._total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                    self._total -= size
+                except OSError:
+                    pass
+        self.log.info(f"Thumbnail cache trimmed to {self._total // 1024} KiB")
+
+class CacheWarmer:
+    """Headless --warm-cache: catch the library index and thumbnails up with the disk"""
+    NICE = 19
+    WINDOW = 4  # Decodes in flight per worker
+    _cache = None  # Set in each worker process
+    
+    def __init__(self, settings_store, workers=None, cache_dir=None):
+        self.settings_store = settings_store
+        self.workers = workers or os.cpu_count() or 2
+        cache_mb = settings_store.get_clamped("thumbnailCacheMb", 256)
+        self.cache = ThumbnailCache(cache_dir, max_bytes=cache_mb * 1024 * 1024)
+        self.log = logging.getLogger('CacheWarmer')
+    
+    def _lower_priority(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, self.NICE)
+        except OSError as e:
+            self.log.warning(f"Failed to lower CPU priority: {e}")
+        # Pool workers inherit both priorities
+        try:
+            subprocess.run(["ionice", "-c", "3", "-p", str(os.getpid())], check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=5)
+        except (OSError, subprocess.SubprocessError):
+            self.log.warning("ionice unavailable, decoding at normal I/O priority")
+    
+    def _lock(self):
+        """Open and exclusively lock warm.lock, or None if another run holds it"""
+        lock_dir = self.cache.cache_dir.parent
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        lock = open(lock_dir / "warm.lock", "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
             return None
+        return lock
+    
+    @classmethod
+    def _init_worker(cls, cache_dir, max_bytes):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent cancels the pool
+        cls._cache = ThumbnailCache(cache_dir, max_bytes)
+    
+    @classmethod
+    def _warm(cls, preview_path, wallpaper_id):
+        """(was already fresh, thumbnail bytes), or None if the preview can't be decoded"""
+        cache = cls._cache
+        try:
+            fresh = cache.lookup(preview_path, wallpaper_id) is not None
+            if not fresh:
+                cache.store(preview_path, wallpaper_id, cache.decode(preview_path))
+            return fresh, cache._thumb_path(preview_path).stat().st_size
+        except (GLib.Error, OSError) as e:
+            cache.log.warning(f"Failed to decode preview for {wallpaper_id}: {e}")
+            return None
+    
+    def run(self):
+        """Warm the caches; returns an exit status"""
+        wallpaper_dir = os.path.expanduser(self.settings_store.get("wallpaperDir", ""))
+        if not wallpaper_dir:
+            self.log.error("No wallpaper directory configured")
+            return 1
+        lock = self._lock()
+        if lock is None:
+            self.log.info("Another cache warm-up is running")
+            return 0
+        
+        started = time.monotonic()
+        previous_handler = signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            self._lower_priority()
+            library = LibraryIndex(wallpaper_dir)
+            try:
+                library.refresh()
+                entries = library.entries()
+            finally:
+                library.close()
             
+            budget = self.cache.max_bytes * 0.9  # Past this the cache would trim what was just warmed
+            cached = rendered = failed = size = 0
+            remaining = iter(entries)
+            pending = set()
+            pool = ProcessPoolExecutor(self.workers, initializer=CacheWarmer._init_worker,
+                                       initargs=(self.cache.cache_dir, self.cache.max_bytes))
+            try:
+                while True:
+                    # Leave room for what is still in flight, at the average thumbnail size so far
+                    average = size / max(1, cached + rendered)
+                    while (len(pending) < self.workers * self.WINDOW and
+                           size + len(pending) * average < budget):
+                        entry = next(remaining, None)
+                        if entry is None:
+                            break
+                        pending.add(pool.submit(CacheWarmer._warm, entry[1], entry[0]))
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        if result is None:
+                            failed += 1
+                            continue
+                        fresh, thumb_size = result
+                        size += thumb_size
+                        if fresh:
+                            cached += 1
+                        else:
+                            rendered += 1
+            finally:
+                pool.shutdown(cancel_futures=True)
+        except KeyboardInterrupt:
+            self.log.info("Cache warm-up interrupted; the next run resumes where this one stopped")
+            return 130
         finally:
-            if parent_window:
-                parent_window.set_sensitive(True)
-                # Restore original status if there was no error
-                if hasattr(parent_window, 'status_label') and result and result.returncode == 0:
-                    parent_window.status_label.set_text(original_text)
-    
-    def run_async(self, *args, callback=None):
-        """Async run only for operations that truly need it"""
-        thread = threading.Thread(target=lambda: callback(self.run(*args)) if callback else self.run(*args))
-        thread.daemon = True
-        thread.start()
+            signal.signal(signal.SIGTERM, previous_handler)
+            lock.close()
+        
+        skipped = len(entries) - cached - rendered - failed
+        self.log.info(f"Cache warm-up: {rendered} thumbnails rendered, {cached} already fresh, "
+                      f"{failed} failed, {skipped} over the {self.cache.max_bytes // (1024 * 1024)} MB budget "
+                      f"in {time.monotonic() - started:.1f}s")
+        return 0
+
+class PixbufCache:
+    """LRU of decoded thumbnails, bounded by pixel memory instead of entry count"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def put(self, key, pixbuf):
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key).get_byte_length()
+        self._entries[key] = pixbuf
+        self.bytes += pixbuf.get_byte_length()
+        return self._shrink()
+    
+    def touch(self, keys):
+        """Mark keys as most recently used"""
+        for key in keys:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+    
+    def resize(self, max_bytes):
+        self.max_bytes = max_bytes
+        return self._shrink()
+    
+    def discard(self, keys):
+        for key in keys:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key).get_byte_length()
+    
+    def retain(self, keys):
+        """Drop every entry not in keys"""
+        keys = set(keys)
+        evicted = [key for key in self._entries if key not in keys]
+        for key in evicted:
+            self.bytes -= self._entries.pop(key).get_byte_length()
+        return evicted
+    
+    def _shrink(self):
+        evicted = []
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            key, pixbuf = self._entries.popitem(last=False)
+            self.bytes -= pixbuf.get_byte_length()
+            evicted.append(key)
+        return evicted
+
+class PreviewLoader:
+    """Decodes thumbnails on a bounded pool of worker threads"""
+    def __init__(self, thumbnail_cache, workers=None):
+        self.cache = thumbnail_cache
+        self.log = logging.getLogger('PreviewLoader')
+        self.generation = 0
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()  # Keeps FIFO order among equal priorities
+        self._pending = {}  # wallpaper_id -> (preview_path, callback)
+        self._in_flight = 0  # Taken from the queue but not yet delivered
+        self._lock = threading.Lock()
+        
+        for _ in range(workers or os.cpu_count() or 2):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+    
+    def submit(self, preview_path, wallpaper_id, callback, priority=0):
+        """Queue a decode; callback(wallpaper_id, pixbuf) runs on the main thread"""
+        with self._lock:
+            self._pending[wallpaper_id] = (preview_path, callback)
+            self._queue.put((priority, next(self._seq), self.generation, wallpaper_id))
+    
+    def prioritize(self, wallpaper_ids, priority=-1):
+        """Move still-pending decodes ahead of the rest of the queue"""
+        with self._lock:
+            for wallpaper_id in wallpaper_ids:
+                if wallpaper_id in self._pending:
+                    self._queue.put((priority, next(self._seq), self.generation, wallpaper_id))
+    
+    def clear(self):
+        """Drop pending decodes without invalidating the current generation"""
+        with self._lock:
+            dropped = list(self._pending)
+            self._pending.clear()
+        return dropped
+    
+    def cancel(self):
+        with self._lock:
+            self.generation += 1
+            self._pending.clear()
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+    
+    def _worker(self):
+        while True:
+            _, _, generation, wallpaper_id = self._queue.get()
+            with self._lock:
+                # Stale generation, or already taken through a reprioritized entry
+                if generation != self.generation or wallpaper_id not in self._pending:
+                    continue
+                preview_path, callback = self._pending.pop(wallpaper_id)
+                self._in_flight += 1
+            
+            try:
+                pixbuf = self.cache.load(preview_path, wallpaper_id)
+            except (GLib.Error, OSError) as e:
+                self.log.warning(f"Failed to decode preview for {wallpaper_id}: {e}")
+                pixbuf = None
+            GLib.idle_add(self._deliver, generation, callback, wallpaper_id, pixbuf)
+    
+    def _deliver(self, generation, callback, wallpaper_id, pixbuf):
+        with self._lock:
+            self._in_flight -= 1
+        if generation == self.generation and pixbuf is not None:
+            callback(wallpaper_id, pixbuf)
+        return False
+    
+    @property
+    def idle(self):
+        with self._lock:
+            return not self._pending and not self._in_flight
+
+class SettingsStore:
+    """In-memory view of settings-schema.json with debounced, atomic writes"""
+    DEBOUNCE_MS = 400
+    # Keys that only take effect when the engine is relaunched
+    ENGINE_KEYS = {"linuxWpePath", "screenRoot", "volumeLevel", "muteAudio", "noAutomute",
+                   "noAudioProcessing", "scalingMode", "clampingMode", "maxFps",
+                   "noFullscreenPause", "disableMouse"}
+    RANGES = {"volumeLevel": (0, 100), "maxFps": (1, 240), "shuffleInterval": (1, 1440),
+              "thumbnailCacheMb": (16, 4096), "pixbufCacheMb": (16, 1024),
+              "prewarmMemoryMb": (64, 8192), "batteryMaxFps": (1, 240),
+              "maxCpuPercent": (0, 100), "batteryMaxCpuPercent": (1, 100)}
+    CHOICES = {"scalingMode": ("default", "stretch", "fit", "fill"),
+               "clampingMode": ("clamp", "border", "repeat")}
+    BOOLEANS = {"muteAudio", "disableMouse", "noAutomute", "noAudioProcessing", "noFullscreenPause",
+                "prewarmEngine", "shuffleEnabled", "batterySaver"}
+    
+    def __init__(self, path, on_flush=None):
+        self.path = Path(path)
+        self.on_flush = on_flush
+        self.log = logging.getLogger('SettingsStore')
+        self.data = self._read()
+        self._pending = {}
+        self._timeout = 0
+        self._lock = threading.RLock()  # EngineController updates state keys from the command thread
+    
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+    
+    def get(self, key, default=None):
+        value = self.data.get(key, {}).get("value", default)
+        if key in self.BOOLEANS and isinstance(value, str):
+            return value.lower() in ("true", "1")
+        return value
+    
+    def get_clamped(self, key, default):
+        """Integer setting limited to its RANGES bounds, or default if it isn't a number"""
+        try:
+            value = int(round(float(self.get(key, default))))
+        except (TypeError, ValueError, OverflowError):
+            value = default
+        low, high = self.RANGES[key]
+        return min(max(value, low), high)
+    
+    def coerce(self, key, value):
+        """Validate and normalize a value the way wallpaper-manager.sh does"""
+        if key in self.RANGES:
+            low, high = self.RANGES[key]
+            value = float(value)
+            if not math.isfinite(value):
+                raise ValueError(f"{key} must be a number")
+            value = int(round(value))
+            if not low <= value <= high:
+                raise ValueError(f"{key} must be between {low} and {high}")
+        elif key in self.CHOICES:
+            value = str(value).lower()
+            if value not in self.CHOICES[key]:
+                raise ValueError(f"{key} must be one of {', '.join(self.CHOICES[key])}")
+        elif key in self.BOOLEANS:
+            value = value if isinstance(value, bool) else str(value).lower() in ("true", "1")
+        return value
+    
+    def set(self, key, value):
+        try:
+            value = self.coerce(key, value)
+        except ValueError as e:
+            self.log.warning(f"Ignoring invalid setting: {e}")
+            return
+        
+        with self._lock:
+            entry = self.data.setdefault(key, {"type": "generic"})
+            if entry.get("value") == value:
+                return
+            entry["value"] = value
+            self._pending[key] = value
+            
+            if self._timeout:
+                GLib.source_remove(self._timeout)
+            self._timeout = GLib.timeout_add(self.DEBOUNCE_MS, self._on_timeout)
+    
+    def _on_timeout(self):
+        with self._lock:
+            self._timeout = 0
+        self.flush()
+        return False
+    
+    def flush(self):
+        """Merge pending changes into the file on disk and write it atomically"""
+        with self._lock:
+            if self._timeout:
+                GLib.source_remove(self._timeout)
+                self._timeout = 0
+            if not self._pending:
+                return
+            changes, self._pending = self._pending, {}
+            with TRACER.span("settings write", keys=",".join(changes)):
+                self._write(changes)
+        
+        self.log.info(f"Saved settings: {', '.join(changes)}")
+        if self.on_flush:
+            self.on_flush(set(changes))
+    
+    def _write(self, changes):
+        # Re-read so keys written by wallpaper-manager.sh meanwhile are kept
+        data = self._read()
+        for key, value in changes.items():
+            entry = data.get(key)
+            if not isinstance(entry, dict):
+                entry = data[key] = {"type": "generic"}
+            entry["value"] = value
+        
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.log.error(f"Failed to write settings: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return
+        
+        # Update in place so holders of self.data see the merged file
+        self.data.clear()
+        self.data.update(data)
+
+class StartupProfiler:
+    """Time from process start to the startup milestones, for --profile-startup"""
+    MILESTONES = ("window", "first-thumbnail", "populated")
+    
+    def __init__(self, enabled=False, start=STARTED):
+        self.enabled = enabled
+        self.start = start
+        self.marks = {}
+        self.log = logging.getLogger('StartupProfiler')
+    
+    def mark(self, milestone):
+        if not self.enabled or milestone in self.marks:
+            return
+        self.marks[milestone] = time.monotonic() - self.start
+        self.log.info(f"Startup: {milestone} after {self.marks[milestone] * 1000:.0f} ms")
+        if milestone == "populated":
+            self.report()
+    
+    def report(self):
+        report = {f"time_to_{milestone.replace('-', '_')}_ms":
+                  round(self.marks[milestone] * 1000, 1) if milestone in self.marks else None
+                  for milestone in self.MILESTONES}
+        print(json.dumps(report), file=sys.stderr, flush=True)
+
+class _NullSpan:
+    """The span handed out while tracing is off; shared, so disabled spans allocate nothing"""
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def set(self, **args):
+        pass
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+    
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+    
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.tracer._record(self.name, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+    
+    def set(self, **args):
+        """Attach arguments known only once the span's work is done"""
+        self.args.update(args)
+
+class Tracer:
+    """Spans and counters for the hot paths, exported as Chrome trace JSON"""
+    MAX_EVENTS = 500000  # Oldest events are dropped past this; histograms keep counting
+    BUCKETS = 40  # Bucket i holds durations below 2**i microseconds
+    
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self._events = deque(maxlen=self.MAX_EVENTS)
+        self._histograms = {}  # span name -> [count, total ns, max ns, bucket counts]
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+    
+    def enable(self, enabled=True):
+        self.enabled = enabled
+    
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self._events.clear()
+            self._histograms.clear()
+    
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+    
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            total = self.counters[name] = self.counters.get(name, 0) + value
+            self._events.append({"name": name, "ph": "C", "ts": (time.perf_counter_ns() - self._origin) / 1000,
+                                 "pid": os.getpid(), "args": {"value": total}})
+    
+    def _record(self, name, start, duration, args):
+        thread = threading.current_thread()
+        event = {"name": name, "cat": "wallpaper-shuffle", "ph": "X", "ts": (start - self._origin) / 1000,
+                 "dur": duration / 1000, "pid": os.getpid(), "tid": thread.ident}
+        if args:
+            event["args"] = args
+        bucket = min((duration // 1000).bit_length(), self.BUCKETS - 1)
+        with self._lock:
+            self._events.append(event)
+            self._threads[thread.ident] = thread.name
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = [0, 0, 0, [0] * self.BUCKETS]
+            histogram[0] += 1
+            histogram[1] += duration
+            histogram[2] = max(histogram[2], duration)
+            histogram[3][bucket] += 1
+    
+    @staticmethod
+    def _percentile(buckets, count, fraction):
+        """Upper bound in ms of the bucket holding the given rank"""
+        seen = 0
+        for index, bucket_count in enumerate(buckets):
+            seen += bucket_count
+            if seen >= fraction * count:
+                return (1 << index) / 1000
+        return None
+    
+    def summary(self):
+        """(spans, counters): per-span count, total/mean/p50/p99/max in ms, and counter totals"""
+        with self._lock:
+            histograms = {name: (h[0], h[1], h[2], list(h[3])) for name, h in self._histograms.items()}
+            counters = dict(self.counters)
+        spans = {}
+        for name, (count, total, longest, buckets) in sorted(histograms.items()):
+            spans[name] = {"count": count, "total_ms": total / 1e6, "mean_ms": total / count / 1e6,
+                           "p50_ms": self._percentile(buckets, count, 0.50),
+                           "p99_ms": self._percentile(buckets, count, 0.99), "max_ms": longest / 1e6}
+        return spans, counters
+    
+    def export(self, path):
+        """Write the recorded events as Chrome trace JSON, atomically"""
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        pid = os.getpid()
+        metadata = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "wallpaper-shuffle"}}]
+        metadata += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                     for tid, name in threads.items()]
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.{pid}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp_path, path)
+        logging.getLogger('Tracer').info(f"Wrote {len(events)} trace events to {path}")
+
+_NULL_SPAN = _NullSpan()
+TRACER = Tracer()
 
 class WidgetFactory:
     @staticmethod
@@ -96,7 +2266,8 @@ class SettingsDialog(Gtk.Dialog):
     def __init__(self, parent):
         super().__init__(title="Wallpaper Shuffle Settings", parent=parent, flags=0)
         self.settings = parent.settings
-        self.script_runner = parent.script_runner
+        self.settings_store = parent.settings_store
+        self.engines = parent.engines
         self.set_default_size(400, 600)
         
         box = self.get_content_area()
@@ -110,19 +2281,36 @@ class SettingsDialog(Gtk.Dialog):
         box.pack_start(notebook, True, True, 0)
         
         pages = {
-            "Basic": self._create_basic_page(),
-            "Audio": self._create_audio_page(),
-            "Display": self._create_display_page(),
-            "Performance": self._create_performance_page()
+            "Basic": self._create_basic_page,
+            "Audio": self._create_audio_page,
+            "Display": self._create_display_page,
+            "Performance": self._create_performance_page,
+            "Diagnostics": self._create_diagnostics_page
         }
         
-        for label, page in pages.items():
-            notebook.append_page(page, Gtk.Label(label=label))
+        # Pages are built the first time they are shown
+        self._page_builders = {}
+        for label, builder in pages.items():
+            holder = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+            self._page_builders[holder] = builder
+            notebook.append_page(holder, Gtk.Label(label=label))
+        notebook.connect("switch-page", self.on_switch_page)
+        self._build_page(notebook.get_nth_page(0))
         
         self.add_button("Close", Gtk.ResponseType.CLOSE)
         self.show_all()
         self.connect("response", self.on_response)
     
+    def on_switch_page(self, notebook, page, page_num):
+        self._build_page(page)
+    
+    def _build_page(self, holder):
+        builder = self._page_builders.pop(holder, None)
+        if builder is not None:
+            page = builder()
+            holder.pack_start(page, True, True, 0)
+            page.show_all()
+    
     def _create_basic_page(self):
         page = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         
@@ -140,6 +2328,20 @@ class SettingsDialog(Gtk.Dialog):
             box.pack_start(chooser, True, True, 0)
             page.pack_start(box, False, False, 0)
         
+        # Automatic shuffle
+        box, switch = WidgetFactory.create_switch("Automatic Shuffle",
+            self.settings.get("shuffleEnabled", {}).get("tooltip", ""),
+            active=self.settings_store.get("shuffleEnabled", False))
+        switch.connect("notify::active", self.on_switch_toggled, "shuffleEnabled")
+        page.pack_start(box, False, False, 0)
+        
+        value = self.settings.get("shuffleInterval", {}).get("value", 10)
+        box, scale = WidgetFactory.create_scale("Shuffle Interval (min):", 1, 1440, 1,
+            self.settings.get("shuffleInterval", {}).get("tooltip", ""),
+            value=value)
+        scale.connect("value-changed", self.on_value_changed, "shuffleInterval")
+        page.pack_start(box, False, False, 0)
+        
         return page
     
     def _create_audio_page(self):
@@ -161,7 +2363,7 @@ class SettingsDialog(Gtk.Dialog):
         ]
         
         for label, setting in switches:
-            active = self.settings.get(setting, {}).get("value", False)
+            active = self.settings_store.get(setting, False)
             box, switch = WidgetFactory.create_switch(label, 
                 self.settings.get(setting, {}).get("tooltip", ""),
                 active=active)
@@ -173,14 +2375,30 @@ class SettingsDialog(Gtk.Dialog):
     def _create_display_page(self):
         page = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         
-        # Screen output
+        # Screen output, used while no per-output engines are enabled
+        self.engines.detector.refresh()
+        detected = self.engines.detector.outputs()
         current_screen = self.settings.get("screenRoot", {}).get("value", "")
-        box, entry = WidgetFactory.create_combo("Screen Output:", 
-            [current_screen] if current_screen else ["Default"],
-            self.settings.get("screenRoot", {}).get("tooltip", ""))
+        screens = detected + ([current_screen] if current_screen and current_screen not in detected else [])
+        box, entry = WidgetFactory.create_combo("Screen Output:", screens or ["Default"],
+            self.settings.get("screenRoot", {}).get("tooltip", ""),
+            active=screens.index(current_screen) if current_screen in screens else None)
         entry.connect("changed", self.on_text_changed, "screenRoot")
         page.pack_start(box, False, False, 0)
         
+        # One engine per enabled output, each with its own queue
+        enabled = set(self.engines.enabled_outputs())
+        if enabled == {None}:
+            enabled = {current_screen or (detected[0] if detected else None)}
+        self.output_switches = {}
+        tooltip = self.settings.get("outputs", {}).get("tooltip", "")
+        for output in detected:
+            box, switch = WidgetFactory.create_switch(f"Wallpaper on {output}", tooltip,
+                                                      active=output in enabled)
+            switch.connect("notify::active", self.on_output_toggled)
+            self.output_switches[output] = switch
+            page.pack_start(box, False, False, 0)
+        
         # Scaling mode
         modes = ["Default", "Stretch", "Fit", "Fill"]
         current_mode = self.settings.get("scalingMode", {}).get("value", "default")
@@ -204,6 +2422,52 @@ class SettingsDialog(Gtk.Dialog):
         scale.connect("value-changed", self.on_value_changed, "maxFps")
         page.pack_start(box, False, False, 0)
         
+        # Thumbnail memory budget
+        value = self.settings.get("pixbufCacheMb", {}).get("value", 64)
+        box, scale = WidgetFactory.create_scale("Thumbnail Memory (MB):", 16, 1024, 16,
+            self.settings.get("pixbufCacheMb", {}).get("tooltip", ""),
+            value=value)
+        scale.connect("value-changed", self.on_value_changed, "pixbufCacheMb")
+        page.pack_start(box, False, False, 0)
+        
+        # Hot-standby switching
+        box, switch = WidgetFactory.create_switch("Hot-standby Switching",
+            self.settings.get("prewarmEngine", {}).get("tooltip", ""),
+            active=self.settings_store.get("prewarmEngine", False))
+        switch.connect("notify::active", self.on_switch_toggled, "prewarmEngine")
+        page.pack_start(box, False, False, 0)
+        
+        value = self.settings.get("prewarmMemoryMb", {}).get("value", 512)
+        box, scale = WidgetFactory.create_scale("Standby Memory Ceiling (MB):", 64, 8192, 64,
+            self.settings.get("prewarmMemoryMb", {}).get("tooltip", ""),
+            value=value)
+        scale.connect("value-changed", self.on_value_changed, "prewarmMemoryMb")
+        page.pack_start(box, False, False, 0)
+        
+        # Battery saver
+        box, switch = WidgetFactory.create_switch("Battery Saver",
+            self.settings.get("batterySaver", {}).get("tooltip", ""),
+            active=self.settings_store.get("batterySaver", True))
+        switch.connect("notify::active", self.on_switch_toggled, "batterySaver")
+        page.pack_start(box, False, False, 0)
+        
+        value = self.settings.get("batteryMaxFps", {}).get("value", 15)
+        box, scale = WidgetFactory.create_scale("Battery FPS Limit:", 1, 240, 1,
+            self.settings.get("batteryMaxFps", {}).get("tooltip", ""),
+            value=value)
+        scale.connect("value-changed", self.on_value_changed, "batteryMaxFps")
+        page.pack_start(box, False, False, 0)
+        
+        # Lightweight-only shuffling, from the profiled per-wallpaper CPU cost
+        for setting, label, low, default in [("maxCpuPercent", "Max Wallpaper CPU % (0 = any):", 0, 0),
+                                             ("batteryMaxCpuPercent", "Max CPU % on Battery:", 1, 15)]:
+            value = self.settings.get(setting, {}).get("value", default)
+            box, scale = WidgetFactory.create_scale(label, low, 100, 1,
+                self.settings.get(setting, {}).get("tooltip", ""),
+                value=value)
+            scale.connect("value-changed", self.on_value_changed, setting)
+            page.pack_start(box, False, False, 0)
+        
         # Performance switches
         switches = [
             ("Disable Fullscreen Pause", "noFullscreenPause"),
@@ -211,7 +2475,7 @@ class SettingsDialog(Gtk.Dialog):
         ]
         
         for label, setting in switches:
-            active = self.settings.get(setting, {}).get("value", False)
+            active = self.settings_store.get(setting, False)
             box, switch = WidgetFactory.create_switch(label,
                 self.settings.get(setting, {}).get("tooltip", ""),
                 active=active)
@@ -220,72 +2484,179 @@ class SettingsDialog(Gtk.Dialog):
         
         return page
     
+    def _create_diagnostics_page(self):
+        page = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        
+        box, switch = WidgetFactory.create_switch("Record Trace",
+            "Time scans, decodes, grid inserts, settings writes and engine spawns/kills",
+            active=TRACER.enabled)
+        switch.connect("notify::active", self.on_trace_toggled)
+        page.pack_start(box, False, False, 0)
+        
+        # Name, count, mean, p99, max; counters only fill in the count
+        self.trace_store = Gtk.ListStore(str, str, str, str, str)
+        view = Gtk.TreeView(model=self.trace_store)
+        for column, title in enumerate(("Span / Counter", "Count", "Mean ms", "p99 ms", "Max ms")):
+            renderer = Gtk.CellRendererText()
+            if column:
+                renderer.set_property("xalign", 1.0)
+            view.append_column(Gtk.TreeViewColumn(title, renderer, text=column))
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        scrolled.add(view)
+        page.pack_start(scrolled, True, True, 0)
+        
+        buttons = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        for label, handler in (("Refresh", self.on_trace_refresh), ("Reset", self.on_trace_reset),
+                               ("Export…", self.on_trace_export)):
+            button = Gtk.Button(label=label)
+            button.connect("clicked", handler)
+            buttons.pack_start(button, False, False, 0)
+        page.pack_start(buttons, False, False, 0)
+        
+        self.on_trace_refresh()
+        return page
+    
+    def on_trace_toggled(self, switch, gparam):
+        TRACER.enable(switch.get_active())
+    
+    def on_trace_refresh(self, button=None):
+        spans, counters = TRACER.summary()
+        self.trace_store.clear()
+        for name, stats in spans.items():
+            self.trace_store.append([name, str(stats["count"]), f"{stats['mean_ms']:.2f}",
+                                     f"≤{stats['p99_ms']:g}", f"{stats['max_ms']:.2f}"])
+        for name, total in sorted(counters.items()):
+            self.trace_store.append([name, str(total), "", "", ""])
+    
+    def on_trace_reset(self, button):
+        TRACER.reset()
+        self.on_trace_refresh()
+    
+    def on_trace_export(self, button):
+        dialog = Gtk.FileChooserDialog(title="Export Trace", parent=self, action=Gtk.FileChooserAction.SAVE)
+        dialog.add_buttons("Cancel", Gtk.ResponseType.CANCEL, "Save", Gtk.ResponseType.ACCEPT)
+        dialog.set_do_overwrite_confirmation(True)
+        dialog.set_current_name(f"wallpaper-shuffle-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        if dialog.run() == Gtk.ResponseType.ACCEPT:
+            try:
+                TRACER.export(dialog.get_filename())
+            except OSError as e:
+                self.get_transient_for().log.error(f"Failed to export trace: {e}")
+        dialog.destroy()
+    
     def on_path_changed(self, chooser, setting):
         path = chooser.get_filename()
         if path:
-            subprocess.run([self.script_runner.script, "settings", setting, path])
-            if setting == "wallpaperDir":
-                self.get_parent().flowbox.foreach(lambda w: w.destroy())
-                self.get_parent().load_wallpapers()
+            self.settings_store.set(setting, path)
     
     def on_value_changed(self, widget, setting):
-        value = widget.get_value()
-        subprocess.run([self.script_runner.script, "settings", setting, str(int(value))])
+        self.settings_store.set(setting, int(widget.get_value()))
     
     def on_switch_toggled(self, switch, gparam, setting):
-        value = "true" if switch.get_active() else "false"
-        subprocess.run([self.script_runner.script, "settings", setting, value])
+        self.settings_store.set(setting, switch.get_active())
+    
+    def on_output_toggled(self, switch, gparam):
+        outputs = [output for output, switch in self.output_switches.items() if switch.get_active()]
+        # A single enabled output is the same as following screenRoot
+        if len(outputs) == 1:
+            self.settings_store.set("screenRoot", outputs[0])
+            outputs = []
+        self.settings_store.set("outputs", ",".join(outputs))
     
     def on_text_changed(self, entry, setting):
         value = entry.get_active_text()
         if value:
-            subprocess.run([self.script_runner.script, "settings", setting, value])
+            self.settings_store.set(setting, value)
     
     def on_combo_changed(self, combo, setting):
-        value = combo.get_active_text().lower()
-        subprocess.run([self.script_runner.script, "settings", setting, value])
+        self.settings_store.set(setting, combo.get_active_text().lower())
     
     def on_response(self, dialog, response_id):
         if response_id == Gtk.ResponseType.CLOSE:
+            self.settings_store.flush()
             self.destroy()
 
 class WallpaperShuffleWindow(Gtk.Window):
-    def __init__(self):
+    THUMBNAIL_BYTES = ThumbnailCache.SIZE * ThumbnailCache.SIZE * 4  # Largest decoded thumbnail, RGBA
+    
+    def __init__(self, profiler=None, settings_file=None):
         super().__init__(title="Wallpaper Shuffle")
         self.set_default_size(800, 600)
         
         # Initialize logger
         self.log = logging.getLogger('Window')
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        
-        script_path = os.path.expanduser("~/.local/share/cinnamon/applets/wallpaper-shuffle@abcdqfr/wallpaper-manager.sh")
-        self.script_runner = ScriptRunner(script_path)
         
         # Load settings
-        self.settings_file = Path.home() / ".local/share/cinnamon/applets/wallpaper-shuffle@abcdqfr/settings-schema.json"
-        self.load_settings()
+        self.settings_file = Path(settings_file or SETTINGS_FILE)
+        self.settings_store = SettingsStore(self.settings_file, on_flush=self.on_settings_flushed)
+        self.settings = self.settings_store.data
+        self.library = None
+        self.engines = EngineSupervisor(self.settings_store, on_done=self.on_command_done)
+        self.service = None
+        
+        cache_mb = self.settings_store.get_clamped("thumbnailCacheMb", 256)
+        self.thumbnail_cache = ThumbnailCache(max_bytes=cache_mb * 1024 * 1024)
+        self.preview_loader = PreviewLoader(self.thumbnail_cache)
+        budget_mb = self.settings_store.get_clamped("pixbufCacheMb", 64)
+        self.pixbuf_cache = PixbufCache(budget_mb * 1024 * 1024)
+        self.visible_ids = []
+        self.row_index = {}  # wallpaper_id -> Gtk.TreeIter in self.store
+        self.search_index = SearchIndex()
+        self.search_matches = None  # None shows everything
+        self.hidden = set()  # wallpaper_ids filtered out by the current search
+        self.requested = set()  # wallpaper_ids already handed to the decode pool
+        self._viewport_update = 0
+        self._last_scroll = 0.0
+        self.profiler = profiler or StartupProfiler()
+        self.library_ready = False
+        self.tray_icon = None
+        self.scheduler = None
+        self.costs = {}  # wallpaper_id -> (CPU %, RSS bytes), for the grid badges
         
         self.main_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         self.add(self.main_box)
         
         self._create_toolbar()
-        self._create_flowbox()
-        self.create_tray_icon()
-        self.load_wallpapers()
+        self._create_grid()
+        # Tray icon and library scan wait until the first frame is on screen
+        self._first_draw = self.connect("draw", self._on_first_draw)
         
         self.connect("delete-event", self.on_window_delete)
         # Register cleanup on window destroy
         self.connect("destroy", self.on_destroy)
     
-    def load_settings(self):
-        try:
-            with open(self.settings_file) as f:
-                self.settings = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.settings = {}
+    def _on_first_draw(self, widget, cr):
+        self.disconnect(self._first_draw)
+        self.profiler.mark("window")
+        GLib.idle_add(self._finish_startup)
+        return False
+    
+    def _finish_startup(self):
+        self.create_tray_icon()
+        self.service = ControlService(self.settings_store, self.engines)
+        self.load_wallpapers()
+        self.scheduler = ShuffleScheduler(self.settings_store, self.engines, self.engines)
+        self.cost_profiler = CostProfiler(self.engines, on_update=self.on_cost_updated)
+        return False
+    
+    @property
+    def engine(self):
+        """Engine of the first enabled output; its playlist holds the favorites"""
+        return self.engines.primary
+    
+    def on_settings_flushed(self, changed_keys):
+        # One restart per affected engine for the whole batch of changes
+        self.engines.apply_settings(changed_keys)
+        if "outputs" in changed_keys:
+            self._update_targets()
+        if self.scheduler is not None:
+            self.scheduler.apply_settings(changed_keys)
+        # Also reached by SetSetting over D-Bus, not only by the Settings dialog
+        if "pixbufCacheMb" in changed_keys:
+            self.set_pixbuf_budget(self.settings_store.get_clamped("pixbufCacheMb", 64))
+        if "wallpaperDir" in changed_keys:
+            self.reload_wallpapers()
     
     def _create_toolbar(self):
         toolbar = Gtk.Toolbar()
@@ -303,6 +2674,7 @@ class WallpaperShuffleWindow(Gtk.Window):
             ("media-skip-backward-symbolic", "Previous", self.on_prev_clicked),
             ("media-skip-forward-symbolic", "Next", self.on_next_clicked),
             ("media-playlist-shuffle-symbolic", "Random", self.on_random_clicked),
+            ("starred-symbolic", "Favorite (shuffled in more often)", self.on_favorite_clicked),
             ("preferences-system-symbolic", "Settings", self.on_settings_clicked)
         ]
         
@@ -312,19 +2684,68 @@ class WallpaperShuffleWindow(Gtk.Window):
             button.set_tooltip_text(tooltip)
             button.connect("clicked", callback)
             toolbar.insert(button, -1)
+        
+        # Which output the buttons and grid act on, shown with more than one output
+        self.target_combo = Gtk.ComboBoxText()
+        self.target_combo.set_tooltip_text("Screen to change")
+        self.target_item = Gtk.ToolItem()
+        self.target_item.add(self.target_combo)
+        self.target_item.set_no_show_all(True)
+        toolbar.insert(self.target_item, -1)
+        self._update_targets()
+        
+        # Search by title, tag, type or ID
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.set_placeholder_text("Search wallpapers")
+        self.search_entry.connect("search-changed", self.on_search_changed)
+        item = Gtk.ToolItem()
+        item.set_expand(True)
+        item.add(self.search_entry)
+        toolbar.insert(item, -1)
+    
+    def _update_targets(self):
+        outputs = [output for output in self.engines.engines if output is not None]
+        selected = self.target_combo.get_active_id()
+        self.target_combo.remove_all()
+        self.target_combo.append("", "All screens")
+        for output in outputs:
+            self.target_combo.append(output, output)
+        if not selected or not self.target_combo.set_active_id(selected):
+            self.target_combo.set_active_id("")
+        self.target_item.set_visible(len(outputs) > 1)
+        self.target_combo.set_visible(len(outputs) > 1)
     
-    def _create_flowbox(self):
+    def target_output(self):
+        """Output picked in the toolbar, or None for all of them"""
+        return self.target_combo.get_active_id() or None
+    
+    def _create_grid(self):
         scrolled = Gtk.ScrolledWindow()
         scrolled.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
         self.main_box.pack_start(scrolled, True, True, 0)
         
-        self.flowbox = Gtk.FlowBox()
-        self.flowbox.set_valign(Gtk.Align.START)
-        self.flowbox.set_max_children_per_line(30)
-        self.flowbox.set_selection_mode(Gtk.SelectionMode.SINGLE)
-        self.flowbox.connect("child-activated", self.on_wallpaper_selected)
+        # wallpaper_id, label markup, thumbnail, preview path, matches search, tooltip
+        self.store = Gtk.ListStore(str, str, GdkPixbuf.Pixbuf, str, bool, str)
+        self.filter = self.store.filter_new()
+        self.filter.set_visible_column(4)
+        # One shared blank pixbuf keeps the layout stable until thumbnails arrive
+        self.placeholder = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, True, 8,
+                                                ThumbnailCache.SIZE, ThumbnailCache.SIZE)
+        self.placeholder.fill(0)
+        
+        self.grid = Gtk.IconView.new_with_model(self.filter)
+        self.grid.set_markup_column(1)
+        self.grid.set_pixbuf_column(2)
+        self.grid.set_tooltip_column(5)
+        self.grid.set_item_width(ThumbnailCache.SIZE)
+        self.grid.set_selection_mode(Gtk.SelectionMode.SINGLE)
+        self.grid.set_activate_on_single_click(True)
+        self.grid.connect("item-activated", self.on_wallpaper_selected)
+        self.grid.connect("size-allocate", self._queue_viewport_update)
         
-        scrolled.add(self.flowbox)
+        scrolled.add(self.grid)
+        self.scrolled = scrolled
+        scrolled.get_vadjustment().connect("value-changed", self._queue_viewport_update)
     
     def create_tray_icon(self):
         self.tray_icon = Gtk.StatusIcon()
@@ -354,34 +2775,52 @@ class WallpaperShuffleWindow(Gtk.Window):
         
         self.tray_menu.show_all()
     
+    def reload_wallpapers(self):
+        self.preview_loader.cancel()
+        self.load_wallpapers()
+    
     def load_wallpapers(self):
+        generation = self.preview_loader.generation
+        self.store.clear()
+        self.row_index = {}
+        self.requested = set()
+        self.pixbuf_cache.retain(())
+        self.search_index = SearchIndex()
+        self.search_matches = self.search_index.search(self.search_entry.get_text())
+        self.hidden = set()
+        self.library_ready = False
+        
+        wallpaper_dir = os.path.expanduser(self.settings.get("wallpaperDir", {}).get("value", ""))
+        self.log.info(f"Loading previews from: {wallpaper_dir}")
+        if not wallpaper_dir:
+            self.log.error("No wallpaper directory configured")
+            return
+        
+        previous, self.library = self.library, LibraryIndex(wallpaper_dir)
+        library = self.library
+        # Move the playlists over before closing the old index under them
+        self.engines.attach_library(library)
+        if previous is not None:
+            previous.close()
+        
+        def on_library_changed(added, removed, changed):
+            self.on_library_changed(added, removed, changed, generation)
+        
+        def on_library_scanned(added, removed, changed):
+            self.on_library_changed(added, removed, changed, generation)
+            if generation == self.preview_loader.generation:
+                self.library_ready = True
+                self._check_populated()
+        
         def load_previews():
-            wallpaper_dir = os.path.expanduser(self.settings.get("wallpaperDir", {}).get("value", ""))
-            self.log.info(f"Loading previews from: {wallpaper_dir}")
-            
-            if not wallpaper_dir:
-                self.log.error("No wallpaper directory configured")
-                return
-            
             try:
-                wallpapers = os.listdir(wallpaper_dir)
-                self.log.info(f"Found {len(wallpapers)} potential wallpaper directories")
-                
-                for wallpaper_id in wallpapers:
-                    path = os.path.join(wallpaper_dir, wallpaper_id)
-                    if os.path.isdir(path):
-                        self.log.debug(f"Scanning directory: {wallpaper_id}")
-                        preview_file = next((f for f in os.listdir(path) 
-                                           if f.startswith("preview.") and 
-                                           f.endswith((".jpg", ".png", ".gif"))), None)
-                        if preview_file:
-                            preview_path = os.path.join(path, preview_file)
-                            self.log.debug(f"Found preview for {wallpaper_id}: {preview_file}")
-                            GLib.idle_add(lambda p=preview_path, w=wallpaper_id: 
-                                self.add_wallpaper_preview(p, w))
-                        else:
-                            self.log.warning(f"No valid preview found for {wallpaper_id}")
-                            
+                # Show what the index knew from last time, then catch up with the disk
+                self.costs = library.costs()
+                entries = library.entries()
+                for start in range(0, len(entries), 256):
+                    GLib.idle_add(self.add_wallpaper_previews, entries[start:start + 256], generation)
+                GLib.idle_add(on_library_scanned, *library.refresh())
+                GLib.idle_add(library.watch, on_library_changed)
             except Exception as e:
                 self.log.error(f"Failed to load wallpapers: {e}", exc_info=True)
         
@@ -389,62 +2828,224 @@ class WallpaperShuffleWindow(Gtk.Window):
         thread.daemon = True
         thread.start()
     
-    def add_wallpaper_preview(self, preview_path, wallpaper_id):
-        try:
-            # Only load first frame of GIFs
-            if preview_path.lower().endswith('.gif'):
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(
-                    preview_path, 
-                    200, 200
-                )
-                # Force load only first frame
-                pixbuf = pixbuf.get_static_image()
-            else:
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(
-                    preview_path, 
-                    200, 200, 
-                    True
-                )
-            
-            image = Gtk.Image.new_from_pixbuf(pixbuf)
-            box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
-            box.pack_start(image, True, True, 0)
-            
-            label = Gtk.Label(label=wallpaper_id)
-            box.pack_start(label, False, False, 0)
-            
-            box.wallpaper_id = wallpaper_id
-            self.flowbox.add(box)
-            box.show_all()  # Ensure widget is visible
-            
-        except Exception as e:
-            print(f"Error loading preview for {wallpaper_id}: {e}")
+    def add_wallpaper_previews(self, batch, generation):
+        """Append rows with the placeholder; thumbnails are decoded once they scroll into view"""
+        if generation != self.preview_loader.generation:
+            return False
+        
+        with TRACER.span("widget insert", rows=len(batch)):
+            for wallpaper_id, preview_path, title, kind, tags, rating in batch:
+                if not preview_path or wallpaper_id in self.row_index:
+                    continue
+                self.search_index.add(wallpaper_id, title, kind, tags, rating)
+                visible = self.search_matches is None or wallpaper_id in self.search_matches
+                if not visible:
+                    self.hidden.add(wallpaper_id)
+                self.row_index[wallpaper_id] = self.store.append(
+                    [wallpaper_id, self._label(wallpaper_id, title), self.placeholder, preview_path, visible,
+                     self._tooltip(wallpaper_id, title, kind, tags)])
+        self._queue_viewport_update()
+        return False
     
-    def on_wallpaper_selected(self, flowbox, child):
-        wallpaper_id = child.get_child().wallpaper_id
-        self.log.info(f"Loading wallpaper: {wallpaper_id}")
+    def _label(self, wallpaper_id, title):
+        """Title plus a resource cost badge once the wallpaper has been profiled"""
+        label = GLib.markup_escape_text(title or wallpaper_id)
+        if self.engine.playlist is not None and self.engine.playlist.is_favorite(wallpaper_id):
+            label = "★ " + label
+        cost = self.costs.get(wallpaper_id)
+        if cost:
+            label += f"\n<small>{cost[0]:.0f}% CPU · {cost[1] // 1048576} MB</small>"
+        return label
+    
+    def on_cost_updated(self, wallpaper_id, cost):
+        self.costs[wallpaper_id] = cost
+        self._refresh_label(wallpaper_id)
+    
+    def _refresh_label(self, wallpaper_id):
+        tree_iter = self.row_index.get(wallpaper_id)
+        if tree_iter is not None and self.library is not None:
+            entry = self.library.entry(wallpaper_id)
+            self.store.set_value(tree_iter, 1, self._label(wallpaper_id, entry[2] if entry else None))
+    
+    @staticmethod
+    def _tooltip(wallpaper_id, title, kind, tags):
+        """Pango markup: GtkIconView shows the tooltip column with gtk_tooltip_set_markup"""
+        details = " · ".join(GLib.markup_escape_text(part)
+                             for part in (kind, (tags or "").replace(",", ", ")) if part)
+        return "\n".join(part for part in (GLib.markup_escape_text(title or ""), details,
+                                            GLib.markup_escape_text(wallpaper_id)) if part)
+    
+    def on_library_changed(self, added, removed, changed, generation):
+        if generation != self.preview_loader.generation:
+            return False
+        
+        for wallpaper_id in removed:
+            self.search_index.remove(wallpaper_id)
+            self.hidden.discard(wallpaper_id)
+            tree_iter = self.row_index.pop(wallpaper_id, None)
+            if tree_iter is not None:
+                self.store.remove(tree_iter)
+        self.pixbuf_cache.discard(removed)
+        if added or removed:
+            self.engines.reload_playlists()
         
-        # Direct synchronous call - no callback needed
-        result = self.script_runner.run("load", wallpaper_id)
+        for entry in changed:
+            wallpaper_id, preview_path, title, kind, tags, rating = entry
+            tree_iter = self.row_index.get(wallpaper_id)
+            if tree_iter is None:
+                added.append(entry)
+                continue
+            # Re-add so the metadata and preview path are current
+            self.search_index.remove(wallpaper_id)
+            self.hidden.discard(wallpaper_id)
+            self.store.remove(self.row_index.pop(wallpaper_id))
+            self.requested.discard(wallpaper_id)
+            added.append(entry)
+        self.pixbuf_cache.discard(entry[0] for entry in changed)
         
-        if result and result.returncode == 0:
-            self.log.debug(f"Load succeeded for {wallpaper_id}")
-            self.status_label.set_text(f"Current: {wallpaper_id}")
+        self.add_wallpaper_previews(added, generation)
+        if self.search_matches is not None:
+            self.on_search_changed(self.search_entry)
+        return False
+    
+    def on_search_changed(self, entry):
+        """Flip the visibility column only for rows whose match state changed"""
+        self.search_matches = self.search_index.search(entry.get_text())
+        if self.search_matches is None:
+            hidden = set()
         else:
-            self.log.error(f"Failed to load {wallpaper_id}")
+            hidden = self.row_index.keys() - self.search_matches
+        for wallpaper_id in hidden ^ self.hidden:
+            tree_iter = self.row_index.get(wallpaper_id)
+            if tree_iter is not None:
+                self.store.set_value(tree_iter, 4, wallpaper_id not in hidden)
+        self.hidden = hidden
+        self._queue_viewport_update()
+    
+    def on_preview_decoded(self, wallpaper_id, pixbuf):
+        tree_iter = self.row_index.get(wallpaper_id)
+        if tree_iter is not None:
+            with TRACER.span("widget insert", id=wallpaper_id):
+                self.store.set_value(tree_iter, 2, pixbuf)
+            self._release_rows(self.pixbuf_cache.put(wallpaper_id, pixbuf))
+            self.profiler.mark("first-thumbnail")
+        self._check_populated()
+    
+    def _check_populated(self):
+        """Startup is complete once the scan is in and the first screenful is decoded"""
+        if (self.library_ready and not self._viewport_update and self.preview_loader.idle):
+            self.profiler.mark("populated")
+    
+    def _release_rows(self, wallpaper_ids):
+        """Point evicted rows back at the placeholder so they reload from disk on demand"""
+        for wallpaper_id in wallpaper_ids:
+            self.requested.discard(wallpaper_id)
+            tree_iter = self.row_index.get(wallpaper_id)
+            if tree_iter is not None:
+                self.store.set_value(tree_iter, 2, self.placeholder)
+    
+    def set_pixbuf_budget(self, budget_mb):
+        self._release_rows(self.pixbuf_cache.resize(budget_mb * 1024 * 1024))
+    
+    def drop_offscreen_thumbnails(self):
+        for wallpaper_id in self.preview_loader.clear():
+            self.requested.discard(wallpaper_id)
+        self._release_rows(self.pixbuf_cache.retain(self.visible_ids))
+    
+    def _queue_viewport_update(self, *args):
+        if not self._viewport_update:
+            self._viewport_update = GLib.idle_add(self._update_viewport)
+    
+    def _update_viewport(self):
+        """Decode visible rows first, then prefetch ahead in the scroll direction"""
+        self._viewport_update = 0
+        visible = self.grid.get_visible_range()
+        if not visible:
+            self._check_populated()
+            return False
+        first, last = visible[0].get_indices()[0], visible[1].get_indices()[0]
+        
+        value = self.scrolled.get_vadjustment().get_value()
+        forward = value >= self._last_scroll
+        self._last_scroll = value
+        
+        span = last - first + 1
+        ahead, behind = span * 2, span // 2
+        # Prefetch only what the pixbuf budget can hold next to the visible rows; a wider
+        # window would evict rows it still covers and request them again, decoding forever
+        room = max(0, self.pixbuf_cache.max_bytes // self.THUMBNAIL_BYTES - span)
+        if ahead + behind > room:
+            ahead, behind = room * ahead // (ahead + behind), room * behind // (ahead + behind)
+        if not forward:
+            ahead, behind = behind, ahead
+        start = max(0, first - behind)
+        model = self.grid.get_model()
+        end = min(len(model) - 1, last + ahead)
+        
+        visible_ids = []
+        for index in range(start, end + 1):
+            row = model[index]
+            wallpaper_id = row[0]
+            if first <= index <= last:
+                visible_ids.append(wallpaper_id)
+            if wallpaper_id not in self.requested:
+                self.requested.add(wallpaper_id)
+                distance = max(first - index, index - last, 0)
+                self.preview_loader.submit(row[3], wallpaper_id, self.on_preview_decoded,
+                                           priority=distance)
+        self.visible_ids = visible_ids
+        self.pixbuf_cache.touch(visible_ids)
+        self.preview_loader.prioritize(visible_ids)
+        self._check_populated()
+        return False
+    
+    def on_wallpaper_selected(self, grid, path):
+        wallpaper_id = grid.get_model()[path][0]
+        self.log.info(f"Loading wallpaper: {wallpaper_id}")
+        self.status_label.set_text(f"Loading {wallpaper_id}...")
+        self.engines.load(wallpaper_id, output=self.target_output())
     
     def on_prev_clicked(self, button):
-        result = self.script_runner.run("prev")
-        if result and result.returncode == 0:
-            self.log.debug("Previous wallpaper loaded successfully")
+        self.status_label.set_text("Working...")
+        self.engines.step(-1, output=self.target_output())
     
     def on_next_clicked(self, button):
-        result = self.script_runner.run("next")
-        if result and result.returncode == 0:
-            self.log.debug("Next wallpaper loaded successfully")
+        self.status_label.set_text("Working...")
+        self.engines.step(1, output=self.target_output())
     
     def on_random_clicked(self, button):
-        self.script_runner.run_async("random")
+        self.status_label.set_text("Working...")
+        self.engines.random(output=self.target_output())
+    
+    def on_favorite_clicked(self, button):
+        if self.engine.playlist is None:
+            return
+        for path in self.grid.get_selected_items():
+            wallpaper_id = self.grid.get_model()[path][0]
+            favorite = self.engine.playlist.toggle_favorite(wallpaper_id)
+            self.status_label.set_text(f"{'Added' if favorite else 'Removed'} {wallpaper_id} "
+                                       f"{'to' if favorite else 'from'} favorites")
+            self._refresh_label(wallpaper_id)
+    
+    def on_command_done(self, kind, ok):
+        if self.service is not None:
+            self.service.emit_state(kind, ok)
+        if self.engines.busy:
+            return  # A newer command is already running; it will report
+        if ok:
+            parts = []
+            for engine in self.engines:
+                text = engine.current or 'None'
+                if engine.output is not None and len(self.engines.engines) > 1:
+                    text = f"{engine.output}: {text}"
+                if kind != "stop" and engine.last_switch:
+                    spawn, blank = engine.last_switch
+                    text += f" (spawned in {spawn * 1000:.0f} ms, {blank * 1000:.0f} ms blank)"
+                parts.append(text)
+            self.status_label.set_text("Current: " + " · ".join(parts))
+        else:
+            self.log.error(f"Command {kind} failed")
+            self.status_label.set_text(f"Error: {kind} failed")
     
     def on_settings_clicked(self, button):
         dialog = SettingsDialog(self)
@@ -455,12 +3056,22 @@ class WallpaperShuffleWindow(Gtk.Window):
         # First hide the window to give user feedback
         self.hide()
         
-        def after_exit(result):
-            # Use GLib.idle_add to safely quit from main thread
-            GLib.idle_add(Gtk.main_quit)
+        def after_exit(ok):
+            self.settings_store.flush()
+            if self.service is not None:
+                self.service.close()
+            try:
+                # Restore the regular Cinnamon desktop background
+                subprocess.Popen(["cinnamon", "--replace"], start_new_session=True,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            except OSError as e:
+                self.log.warning(f"Failed to restart Cinnamon: {e}")
+            Gtk.main_quit()
         
-        # Kill wallpaper engine asynchronously
-        self.script_runner.run_async("exit", callback=after_exit)
+        # Kill wallpaper engine without blocking the main loop; nothing queued after it may restart one
+        self.engines.cancel()
+        self.engines.stop(callback=after_exit)
+        self.engines.close()
     
     def on_tray_right_click(self, icon, button, time):
         self.tray_menu.popup(None, None, None, None, button, time)
@@ -476,35 +3087,122 @@ class WallpaperShuffleWindow(Gtk.Window):
     
     def on_window_delete(self, window, event):
         # Handle window close button
-        if self.tray_icon.get_visible():
+        if self.tray_icon is not None and self.tray_icon.get_visible():
             self.hide()
+            self.drop_offscreen_thumbnails()
             return True  # Prevent destruction
         else:
             # No tray icon, perform clean exit
             self.on_exit_clicked(None)
             return True  # Prevent immediate destruction
     
-    def run_script(self, *args):
-        try:
-            result = subprocess.run([self.script_runner.script] + list(args), 
-                                  capture_output=True, 
-                                  text=True)
-            if result.returncode != 0:
-                print(f"Script error: {result.stderr}")
-            return result
-        except Exception as e:
-            print(f"Failed to run script: {e}")
-            return None
-    
     def on_destroy(self, window):
-        self.script_runner.cleanup()
+        self.settings_store.flush()
         Gtk.main_quit()
 
+def run_service(settings_file):
+    """Headless mode: engines, library, scheduler and ControlService without a window"""
+    log = logging.getLogger('Service')
+    loop = GLib.MainLoop()
+    service = None
+    
+    def on_done(kind, ok):
+        if service is not None:
+            service.emit_state(kind, ok)
+    
+    settings_store = SettingsStore(settings_file)
+    engines = EngineSupervisor(settings_store, on_done=on_done)
+    scheduler = ShuffleScheduler(settings_store, engines, engines)
+    CostProfiler(engines)
+    library = None
+    
+    def load_library():
+        nonlocal library
+        wallpaper_dir = os.path.expanduser(settings_store.get("wallpaperDir", ""))
+        if not wallpaper_dir:
+            log.error("No wallpaper directory configured")
+            return
+        previous, library = library, LibraryIndex(wallpaper_dir)
+        engines.attach_library(library)
+        if previous is not None:
+            previous.close()
+        
+        def scan(index):
+            try:
+                index.refresh()
+            except Exception as e:
+                log.error(f"Failed to scan {index.root}: {e}", exc_info=True)
+            GLib.idle_add(scanned, index)
+        
+        def scanned(index):
+            if index is library:
+                engines.reload_playlists()
+                index.watch(lambda added, removed, changed: engines.reload_playlists())
+            return False
+        
+        thread = threading.Thread(target=scan, args=(library,))
+        thread.daemon = True
+        thread.start()
+    
+    def on_flush(changed_keys):
+        engines.apply_settings(changed_keys)
+        scheduler.apply_settings(changed_keys)
+        if "wallpaperDir" in changed_keys:
+            load_library()
+    
+    settings_store.on_flush = on_flush
+    stopping = False
+    
+    def on_signal():
+        nonlocal stopping
+        stopping = True
+        loop.quit()
+        return False
+    
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGTERM, on_signal)
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGINT, on_signal)
+    service = ControlService(settings_store, engines, replaceable=True, on_name_lost=loop.quit)
+    load_library()
+    loop.run()
+    
+    service.close()
+    settings_store.flush()
+    if stopping:
+        for engine in engines:
+            engine.stop()
+    # Replaced by a window: the engines keep drawing until it stops them through their pid files
+
 def main():
-    win = WallpaperShuffleWindow()
-    win.connect("destroy", Gtk.main_quit)
-    win.show_all()
-    Gtk.main()
+    parser = argparse.ArgumentParser(description="Wallpaper Shuffle")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print time-to-window, time-to-first-thumbnail and "
+                             "time-to-fully-populated as JSON on stderr")
+    parser.add_argument("--service", action="store_true",
+                        help=f"run without a window, controlled over D-Bus as {ControlService.BUS_NAME}")
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="update the library index and thumbnails at low priority, then exit")
+    parser.add_argument("--settings", help="settings-schema.json to use instead of the applet's")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="record hot-path spans and write them as Chrome trace JSON on exit")
+    parser.add_argument("--debug", action="store_true", help="log at DEBUG instead of INFO")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    TRACER.enable(bool(args.trace))
+    try:
+        if args.warm_cache:
+            sys.exit(CacheWarmer(SettingsStore(args.settings or SETTINGS_FILE)).run())
+        elif args.service:
+            run_service(args.settings or SETTINGS_FILE)
+        else:
+            win = WallpaperShuffleWindow(StartupProfiler(args.profile_startup), settings_file=args.settings)
+            win.connect("destroy", Gtk.main_quit)
+            win.show_all()
+            Gtk.main()
+    finally:
+        if args.trace:
+            TRACER.export(args.trace)
 
 if __name__ == "__main__":
     main()